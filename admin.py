@@ -0,0 +1,44 @@
+"""
+File:           admin.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:09 am
+"""
+import os
+
+import flask
+
+from singleflight import singleflight
+from query_log import query_log
+from diagnostics import memory_diagnostics
+
+
+# Admin routes expose internals of the worker. So they are only added when enabled.
+ADMIN_ROUTES_ENABLED = os.environ.get("AUTOCLOUD_ADMIN_ROUTES", "0") == "1"
+
+
+def register_admin_routes(server):
+    """ Add the admin routes to the flask server """
+    if not ADMIN_ROUTES_ENABLED:
+        return
+
+    @server.route("/admin/stats")
+    def admin_stats():
+        return flask.jsonify({
+            "pid": os.getpid(),
+            "singleflight": singleflight.stats(),
+        })
+
+    @server.route("/admin/queries")
+    def admin_queries():
+        return flask.jsonify({
+            "pid": os.getpid(),
+            **query_log.stats(),
+        })
+
+    @server.route("/admin/memory")
+    def admin_memory():
+        limit = flask.request.args.get("limit", 20, type=int)
+        return flask.jsonify({
+            "pid": os.getpid(),
+            **memory_diagnostics.stats(limit=limit),
+        })
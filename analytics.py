@@ -0,0 +1,159 @@
+"""
+File:           analytics.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:11 am
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+from filters import get_filter_key, is_filter_applied, split_make_model_year
+from singleflight import singleflight
+from diagnostics import memory_diagnostics
+
+
+class DealAnalytics:
+    """
+    Aggregates of the potential deals for the analytics tab. Aggregates of the whole snapshot are
+    computed once per snapshot version and the filtered ones are cached.
+    """
+    HISTOGRAM_BINS = 30
+    # No of filtered aggregates kept for the current snapshot version
+    MAX_CACHED_FILTERS = 64
+    # Columns of vw_Deal shown as histograms
+    HISTOGRAM_COLUMNS = ("price", "odometer", "OfferPricePctMMR")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._frame = None
+        self._overall = None
+        self._cache = OrderedDict()
+
+    @staticmethod
+    def get_frame(potential_records, make_model_index):
+        """
+        Data frame of the columns used by the aggregates. Make is split using the vauto_make_model
+        catalog of the make model index.
+        """
+        frame = pd.DataFrame.from_records(
+            potential_records,
+            columns=["PotentialDealID", "make_model_year", *DealAnalytics.HISTOGRAM_COLUMNS]
+        )
+        for column in DealAnalytics.HISTOGRAM_COLUMNS:
+            frame[column] = pd.to_numeric(frame[column], errors="coerce")
+        # Only the distinct values are split. Missing values have code -1, i.e. the last part.
+        codes, make_model_years = pd.factorize(frame["make_model_year"])
+        parts = [split_make_model_year(x, make_model_index) for x in make_model_years] + [("", "")]
+        frame["year"] = np.array([x[0] for x in parts], dtype=object)[codes]
+        frame["make"] = np.array([x[1] for x in parts], dtype=object)[codes]
+        return frame.drop(columns="make_model_year")
+
+    @staticmethod
+    def compute_aggregates(frame):
+        """ Histograms and median price by year and make of the deals in the frame """
+        no_of_deals = len(frame)
+        histograms = {}
+        for column in DealAnalytics.HISTOGRAM_COLUMNS:
+            values = frame[column].dropna().to_numpy()
+            counts, edges = np.histogram(values, bins=DealAnalytics.HISTOGRAM_BINS)
+            histograms[column] = {"counts": counts, "edges": edges}
+        frame = frame[frame["year"] != ""]
+        if len(frame):
+            median_price = (
+                frame.groupby(["make", "year"])["price"].median().unstack("year").sort_index()
+            )
+        else:
+            median_price = pd.DataFrame()
+        return {
+            "no_of_deals": no_of_deals,
+            "histograms": histograms,
+            "median_price": median_price,
+        }
+
+    def _load(self, version, potential_records, make_model_index):
+        """ Build the frame and the whole dataset aggregates for the snapshot version """
+        frame = self.get_frame(potential_records, make_model_index)
+        overall = self.compute_aggregates(frame)
+        with self._lock:
+            self._version = version
+            self._frame = frame
+            self._overall = overall
+            self._cache = OrderedDict()
+
+    def get_aggregates(self, version, potential_records, criteria, filtered_records,
+                       make_model_index):
+        """ Return the aggregates of the filtered records """
+        if version != self._version:
+            singleflight.do(("analytics_load", id(self), version), self._load, version,
+                            potential_records, make_model_index)
+        with self._lock:
+            if version != self._version:
+                # Snapshot changed in between. Compute without the cache.
+                frame, overall = None, None
+            else:
+                frame, overall = self._frame, self._overall
+        if frame is None:
+            frame = self.get_frame(filtered_records, make_model_index)
+            return self.compute_aggregates(frame)
+        if not is_filter_applied(criteria):
+            return overall
+        key = get_filter_key(criteria)
+        with self._lock:
+            aggregates = self._cache.get(key)
+            if aggregates is not None:
+                self._cache.move_to_end(key)
+                return aggregates
+        filtered_ids = [data["PotentialDealID"] for data in filtered_records]
+        aggregates = self.compute_aggregates(frame[frame["PotentialDealID"].isin(filtered_ids)])
+        with self._lock:
+            if version == self._version:
+                self._cache[key] = aggregates
+                while len(self._cache) > DealAnalytics.MAX_CACHED_FILTERS:
+                    self._cache.popitem(last=False)
+        return aggregates
+
+    @staticmethod
+    def get_figures(aggregates):
+        """ Plotly figures of the aggregates """
+        figures = []
+        for column, histogram in aggregates["histograms"].items():
+            edges = histogram["edges"]
+            figure = go.Figure(
+                go.Bar(
+                    x=(edges[:-1] + edges[1:]) / 2,
+                    y=histogram["counts"],
+                    width=np.diff(edges),
+                    marker_color="#00a355",
+                )
+            )
+            figure.update_layout(
+                title=f"{column} distribution", template="plotly_dark", bargap=0.05,
+                margin={"l": 40, "r": 20, "t": 40, "b": 40}, height=300
+            )
+            figures.append(figure)
+        median_price = aggregates["median_price"]
+        figure = go.Figure(
+            go.Heatmap(
+                x=list(median_price.columns),
+                y=list(median_price.index),
+                z=median_price.to_numpy(),
+                colorscale="Viridis",
+                colorbar={"title": "price"},
+            )
+        )
+        figure.update_layout(
+            title="Median price by year and make", template="plotly_dark",
+            margin={"l": 100, "r": 20, "t": 40, "b": 40},
+            height=max(300, 20 * len(median_price.index) + 100)
+        )
+        figures.append(figure)
+        return figures
+
+
+# Shared by the whole process
+deal_analytics = DealAnalytics()
+memory_diagnostics.register_cache("analytics", lambda: deal_analytics)
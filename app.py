@@ -3,15 +3,24 @@ File:           app.py
 Author:         Dibyaranjan Sathua
 Created on:     20/02/21, 12:23 am
 """
+import os
+import time
+
 import dash
 import dash_table
 import dash_html_components as html
 import dash_core_components as dcc
 import dash_bootstrap_components as dbc
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from dash.exceptions import PreventUpdate
 
 from db import DBApi
+from deal_updates import register_deal_update_routes
+from filters import (get_filter_criteria, validate_filter_criteria, filter_potential_records,
+                     is_filter_applied)
+from admin import register_admin_routes
+from analytics import DealAnalytics, deal_analytics
+from diagnostics import memory_diagnostics
 
 
 app = dash.Dash(
@@ -20,17 +29,21 @@ app = dash.Dash(
         {"name": "viewport", "content": "width=device-width, initial-scale=1"},
     ],
 )
+# Server sent events for pushing the deal updates to browsers
+register_deal_update_routes(app.server)
+register_admin_routes(app.server)
+# Toggle the filter options with server callbacks as before the clientside callbacks. Only used by
+# the load test to compare the no of requests per session.
+SERVER_SIDE_TOGGLES = os.environ.get("AUTOCLOUD_SERVER_SIDE_TOGGLES", "0") == "1"
 
 
 class AppLayout:
     """ Class responsible for app layout """
 
     def __init__(self):
-        self._db_api = DBApi()
-        self._potential_deals = []
+        self._db_api = DBApi.get_instance()
         self._potential_deals_cols = []
         self._years = []
-        self._make_model = {}
         self._action_options = []
         self._filters = []
 
@@ -38,6 +51,9 @@ class AppLayout:
         """ Setup the app layout """
         print("Inside setup")
         self.fetch_from_db()
+        memory_diagnostics.register_cache(
+            "layout", lambda: {k: v for k, v in vars(self).items() if k != "_db_api"}
+        )
         # Don't assign to the function output. Assing it to the function object so that whenever we
         # do some changes to layout, it will reflect without server restarting
         app.layout = self.get_root_layout
@@ -45,14 +61,14 @@ class AppLayout:
 
     def fetch_from_db(self):
         """ Fetch data from db """
-        self._potential_deals = DBApi.get_instance().potential_records
+        # Load the snapshot. It is not kept here as it would keep the first snapshot alive after
+        # every reload. Table data is loaded by the filter callback.
+        self._db_api.get_snapshot()
         self._filters = DBApi.get_instance().filters
-        # Add markdown for url
-        for data in self._potential_deals:
-            data["url"] = f"[Link]({data['url']})"
         self._potential_deals_cols = self._db_api.get_potential_deal_columns()
-        self._years = self._db_api.get_unique_years(self._potential_deals)
-        self._make_model = self._db_api.get_all_make_models()
+        self._years = self._db_api.get_unique_years()
+        # Build the make model prefix index once. Options are loaded lazily by the callbacks
+        self._db_api.load_make_model_index()
         self._action_options = ["Action1", "Action2", "Action3"]
 
     def get_nav_bar_layout(self):
@@ -75,7 +91,7 @@ class AppLayout:
                     width="auto"
                 ),
                 dbc.Col(
-                    dbc.Alert(children="", id="real_time_interval_output", color="success",
+                    dbc.Alert(children="", id="bulk_update_alert", color="success",
                               dismissable=True, is_open=False),
                     width="auto"
                 ),
@@ -140,11 +156,16 @@ class AppLayout:
             dbc.Collapse(
                 dbc.FormGroup(
                     children=[
+                        dbc.Input(
+                            type="text",
+                            placeholder="Search make",
+                            id="make_filter_search",
+                            className="mb-2"
+                        ),
+                        # Options are loaded by update_make_options callback
                         dbc.Checklist(
-                            options=[
-                                {"label": make, "value": make.lower()}
-                                for make in self._make_model.keys()
-                            ],
+                            options=[],
+                            value=[],
                             className="ml-4",
                             id="make_actual_filter_options"
                         )
@@ -156,18 +177,24 @@ class AppLayout:
         ]
 
     def get_model_filter(self, color, classname):
-        """ Return make filter """
+        """ Return model filter """
         return [
             dbc.Button("Model", id="model_filter_btn", color=color, className=classname,
                        n_clicks=0),
             dbc.Collapse(
                 dbc.FormGroup(
                     children=[
+                        dbc.Input(
+                            type="text",
+                            placeholder="Search model",
+                            id="model_filter_search",
+                            className="mb-2"
+                        ),
+                        # Options depend on the selected makes and are loaded by
+                        # update_model_options callback
                         dbc.Checklist(
-                            options=[
-                                {"label": model, "value": model.lower()}
-                                for model_list in self._make_model.values() for model in model_list
-                            ],
+                            options=[],
+                            value=[],
                             className="ml-4",
                             id="model_actual_filter_options"
                         )
@@ -311,6 +338,45 @@ class AppLayout:
                        n_clicks=0),
         ]
 
+    def get_sidebar_bulk_update(self):
+        """ Side bar to set action and comment of all the filtered deals """
+        action_options = [{"label": "No change", "value": ""}]
+        action_options.extend({"label": x, "value": x} for x in self._action_options)
+        return [
+            dbc.FormGroup(
+                children=[
+                    dbc.Label("Action", className="mr-2"),
+                    dbc.Select(
+                        options=action_options,
+                        value="",
+                        id="bulk_update_action"
+                    ),
+                ]
+            ),
+            dbc.FormGroup(
+                children=[
+                    dbc.Label("Comment", className="mr-2"),
+                    dbc.Input(
+                        type="text",
+                        placeholder="comment",
+                        id="bulk_update_comment"
+                    ),
+                ]
+            ),
+            # Message shows the no of deals of the applied filter. It is set by the filter callback
+            dcc.ConfirmDialogProvider(
+                children=dbc.Button("Apply to filtered", color="warning", className="mt-2",
+                                    id="bulk_update_btn", n_clicks=0),
+                id="bulk_update_confirm",
+                message="Update all the filtered deals?"
+            ),
+            # Updated after each bulk update so that the table is refreshed from the patched cache
+            dcc.Store(id="bulk_update_done", data=0),
+            # Criteria of the last applied filter. Bulk update uses it instead of the filter
+            # controls which may have been changed without applying
+            dcc.Store(id="applied_filter"),
+        ]
+
     def get_sidebar_saved_filter_names(self):
         """ Show already saved filter names """
         radio_options = [
@@ -335,6 +401,7 @@ class AppLayout:
         return [
             dbc.Card(children=self.get_sidebar_filters(), body=True),
             dbc.Card(children=self.get_sidebar_filter_save(), body=True, className="mt-2"),
+            dbc.Card(children=self.get_sidebar_bulk_update(), body=True, className="mt-2"),
             dbc.Card(children=self.get_sidebar_saved_filter_names(), body=True, className="mt-2")
         ]
 
@@ -348,7 +415,7 @@ class AppLayout:
         return dash_table.DataTable(
             id="potential_deal_table",
             columns=columns,
-            data=self._potential_deals,
+            data=[],
             page_size=20,
             style_table={"overflowX": "auto"},
             editable=True,
@@ -380,6 +447,74 @@ class AppLayout:
             },
         )
 
+    @staticmethod
+    def get_comparables_layout():
+        """ Comparables button and the modal showing the most similar vehicles """
+        return [
+            dbc.Button("Comparables", id="comparables_btn", color="warning",
+                       className="mt-2 mb-2", n_clicks=0),
+            dbc.Modal(
+                children=[
+                    dbc.ModalHeader("Comparable vehicles"),
+                    dbc.ModalBody(dcc.Loading(html.Div(id="comparables_body"), type="default")),
+                    dbc.ModalFooter(
+                        dbc.Button("Close", id="comparables_close_btn", className="ml-auto",
+                                   n_clicks=0)
+                    ),
+                ],
+                id="comparables_modal",
+                size="xl",
+                is_open=False
+            ),
+        ]
+
+    @staticmethod
+    def get_analytics_layout():
+        """ Analytics of the filtered deals. Loaded only when the tab is active """
+        return [
+            dcc.Loading(
+                html.Div(id="analytics_content", className="mt-2"),
+                type="default"
+            )
+        ]
+
+    def get_main_tabs_layout(self):
+        """ Tabs for potential deal table and analytics """
+        return dbc.Tabs(
+            id="main_tabs",
+            active_tab="deals_tab",
+            children=[
+                dbc.Tab(
+                    children=[
+                        *self.get_comparables_layout(),
+                        self.get_potential_deal_table_layout(),
+                    ],
+                    label="Deals",
+                    tab_id="deals_tab"
+                ),
+                dbc.Tab(
+                    children=self.get_analytics_layout(),
+                    label="Analytics",
+                    tab_id="analytics_tab"
+                ),
+            ]
+        )
+
+    @staticmethod
+    def get_deal_update_layout():
+        """ Hidden components to apply the deal updates pushed from the server """
+        return [
+            # Clicked by assets/clientside.js when a server sent event is received
+            html.Button(id="deal_update_trigger", n_clicks=0, style={"display": "none"}),
+            dcc.Store(id="deal_update_event"),
+            # Version of the deal snapshot shown in the table
+            dcc.Store(id="deal_snapshot_version"),
+            # Full filtered data from the server
+            dcc.Store(id="deal_filtered_store"),
+            # Changed rows since the version shown in the table
+            dcc.Store(id="deal_delta_store"),
+        ]
+
     def get_root_layout(self):
         """ Return main page layout """
         layout = dbc.Container(
@@ -388,14 +523,9 @@ class AppLayout:
                 self.get_nav_bar_layout(),
                 dbc.Row(
                     [
-                        # Real time update database
-                        dcc.Interval(
-                            id='real_time_db_update',
-                            interval=300000,  # in milliseconds
-                            n_intervals=0
-                        ),
+                        *self.get_deal_update_layout(),
                         dbc.Col(children=self.get_sidebar_layout(), md=2),
-                        dbc.Col(children=self.get_potential_deal_table_layout(), md=10)
+                        dbc.Col(children=self.get_main_tabs_layout(), md=10)
 
                     ]
                 ),
@@ -409,75 +539,28 @@ class AppLayout:
 
     @staticmethod
     @app.callback(
-        Output(component_id="year_filter_options", component_property="is_open"),
-        Input(component_id="year_filter_btn", component_property="n_clicks"),
-        State(component_id="year_filter_options", component_property="is_open")
-    )
-    def show_hide_year_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
-
-    @staticmethod
-    @app.callback(
-        Output(component_id="make_filter_options", component_property="is_open"),
-        Input(component_id="make_filter_btn", component_property="n_clicks"),
-        State(component_id="make_filter_options", component_property="is_open")
-    )
-    def show_hide_make_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
-
-    @staticmethod
-    @app.callback(
-        Output(component_id="model_filter_options", component_property="is_open"),
-        Input(component_id="model_filter_btn", component_property="n_clicks"),
-        State(component_id="model_filter_options", component_property="is_open")
-    )
-    def show_hide_model_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
-
-    @staticmethod
-    @app.callback(
-        Output(component_id="odometer_filter_options", component_property="is_open"),
-        Input(component_id="odometer_filter_btn", component_property="n_clicks"),
-        State(component_id="odometer_filter_options", component_property="is_open")
+        Output(component_id="make_actual_filter_options", component_property="options"),
+        [Input(component_id="make_filter_search", component_property="value"),
+         Input(component_id="make_actual_filter_options", component_property="value")]
     )
-    def show_hide_odometer_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
+    def update_make_options(search, selected_make):
+        """ Load the make options matching the search text """
+        make_model_index = DBApi.get_instance().make_model_index
+        results = make_model_index.search_makes(prefix=search)
+        return make_model_index.get_options(results, selected=selected_make, is_make=True)
 
     @staticmethod
     @app.callback(
-        Output(component_id="price_filter_options", component_property="is_open"),
-        Input(component_id="price_filter_btn", component_property="n_clicks"),
-        State(component_id="price_filter_options", component_property="is_open")
+        Output(component_id="model_actual_filter_options", component_property="options"),
+        [Input(component_id="make_actual_filter_options", component_property="value"),
+         Input(component_id="model_filter_search", component_property="value"),
+         Input(component_id="model_actual_filter_options", component_property="value")]
     )
-    def show_hide_price_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
-
-    @staticmethod
-    @app.callback(
-        Output(component_id="offer_price_filter_options", component_property="is_open"),
-        Input(component_id="offer_price_filter_btn", component_property="n_clicks"),
-        State(component_id="offer_price_filter_options", component_property="is_open")
-    )
-    def show_hide_offer_price_options(n_clicks, is_open):
-        """ Show or hide the year options """
-        if n_clicks:
-            return not is_open
-        return is_open
+    def update_model_options(selected_make, search, selected_model):
+        """ Load the model options of the selected makes matching the search text """
+        make_model_index = DBApi.get_instance().make_model_index
+        results = make_model_index.search_models(prefix=search, makes=selected_make)
+        return make_model_index.get_options(results, selected=selected_model)
 
     @staticmethod
     @app.callback(
@@ -504,13 +587,15 @@ class AppLayout:
 
     @staticmethod
     @app.callback(
-        [Output(component_id="potential_deal_table", component_property="data"),
+        [Output(component_id="deal_filtered_store", component_property="data"),
+         Output(component_id="applied_filter", component_property="data"),
+         Output(component_id="bulk_update_confirm", component_property="message"),
          Output(component_id="error_alert", component_property="children"),
          Output(component_id="error_alert", component_property="is_open"),
          Output(component_id="error_alert", component_property="duration")],
-        Input(component_id="filter_apply_btn", component_property="n_clicks"),
-        [State(component_id="potential_deal_table", component_property="data"),
-         State(component_id="year_actual_filter_options", component_property="value"),
+        [Input(component_id="filter_apply_btn", component_property="n_clicks"),
+         Input(component_id="bulk_update_done", component_property="data")],
+        [State(component_id="year_actual_filter_options", component_property="value"),
          State(component_id="make_actual_filter_options", component_property="value"),
          State(component_id="model_actual_filter_options", component_property="value"),
          State(component_id="odometer_actual_filter_min", component_property="value"),
@@ -518,139 +603,191 @@ class AppLayout:
          State(component_id="price_actual_filter_min", component_property="value"),
          State(component_id="price_actual_filter_max", component_property="value"),
          State(component_id="offer_price_actual_filter_min", component_property="value"),
-         State(component_id="offer_price_actual_filter_max", component_property="value")]
+         State(component_id="offer_price_actual_filter_max", component_property="value"),
+         State(component_id="applied_filter", component_property="data")]
     )
-    def filter_potential_deal_table(apply_n_clicks, potential_deal_table_data,
-                                    selected_year, selected_make, selected_model, min_odometer,
-                                    max_odometer, min_price, max_price, min_offer_price,
-                                    max_offer_price):
+    def filter_potential_deal_table(apply_n_clicks, bulk_update_done, *filter_values):
         """ Filter potential deals table data """
-        potential_deal_db_data = DBApi.get_instance().potential_records
-        filtered_year_ids = []
-        filtered_make_ids = []
-        filtered_model_ids = []
-        filtered_min_odometer_ids = []
-        filtered_max_odometer_ids = []
-        filtered_min_price_ids = []
-        filtered_max_price_ids = []
-        filtered_min_offer_price_ids = []
-        filtered_max_offer_price_ids = []
-
-        if selected_year or selected_make or min_odometer or max_odometer or min_price or \
-                max_price or min_offer_price or max_offer_price:
-            # Odometer filter
-            if min_odometer and max_odometer:
-                if int(max_odometer) < int(min_odometer):
-                    return [
-                        potential_deal_table_data,
-                        "Max odometer value should be greater than min odometer value",
-                        True,
-                        5000
-                    ]
-            if min_price and max_price:
-                if int(max_price) < int(min_price):
-                    return [
-                        potential_deal_table_data,
-                        "Max price value should be greater than min price value",
-                        True,
-                        5000
-                    ]
+        *filter_values, applied_filter = filter_values
+        ctx = dash.callback_context
+        button_id = ctx.triggered[0]['prop_id'].split('.')[0] if ctx.triggered else None
+        if button_id == "bulk_update_done" and applied_filter is not None:
+            # Refresh after a bulk update keeps the applied filter. The filter controls may have
+            # values which were never applied.
+            criteria = applied_filter
+        else:
+            criteria = get_filter_criteria(*filter_values)
+        error = validate_filter_criteria(criteria)
+        if error is not None:
+            return [dash.no_update, dash.no_update, dash.no_update, error, True, 5000]
+        version, filtered_data = DBApi.get_instance().get_filtered_records(criteria)
+        if is_filter_applied(criteria):
+            message = f"Update action/comment of the {len(filtered_data)} filtered deals?"
+        else:
+            message = f"No filter is applied. Update action/comment of all the " \
+                      f"{len(filtered_data)} deals?"
+        return [{"version": version, "rows": filtered_data}, criteria, message, "", False, 2000]
 
-            if min_offer_price and max_offer_price:
-                if int(max_offer_price) < int(min_offer_price):
-                    return [
-                        potential_deal_table_data,
-                        "Max offer price MMR value should be greater "
-                        "than min offer price MMR value",
-                        True,
-                        5000
-                    ]
+    @staticmethod
+    @app.callback(
+        Output(component_id="deal_delta_store", component_property="data"),
+        Input(component_id="deal_update_event", component_property="data"),
+        [State(component_id="deal_snapshot_version", component_property="data"),
+         State(component_id="applied_filter", component_property="data")]
+    )
+    def get_deal_updates(deal_update_event, table_version, criteria):
+        """ Return the changed rows since the version shown in the table """
+        if not deal_update_event or deal_update_event.get("version") == table_version:
+            raise PreventUpdate
+        if criteria is None:
+            raise PreventUpdate
+        request_time = time.time()
+        db_api = DBApi.get_instance()
+        if deal_update_event.get("version") != db_api.snapshot_version:
+            # Event is from a worker which checked db before this one. Catch up first.
+            db_api.refresh_snapshot(since=request_time)
+        changes = db_api.get_changes_since(table_version)
+        if changes is None:
+            # Table version is unknown to this worker. It may come from a newer snapshot of
+            # another worker, so check db first. The full data is then never older than the table.
+            db_api.refresh_snapshot(since=request_time)
+            changes = db_api.get_changes_since(table_version)
+        if changes is None:
+            version, filtered_data = db_api.get_filtered_records(criteria)
+            return {"version": version, "full": True, "rows": filtered_data}
+        version, changed_records, removed_ids = changes
+        if version == table_version:
+            raise PreventUpdate
+        matching_records = filter_potential_records(changed_records, criteria)
+        matching_ids = {data["PotentialDealID"] for data in matching_records}
+        # Changed rows not matching the filter anymore are removed from the table
+        removed_ids = set(removed_ids)
+        removed_ids.update(
+            data["PotentialDealID"] for data in changed_records
+            if data["PotentialDealID"] not in matching_ids
+        )
+        return {
+            "version": version,
+            "full": False,
+            "rows": matching_records,
+            "removed": list(removed_ids),
+        }
 
-            for data in potential_deal_db_data:
-                # Year filter
-                if selected_year:
-                    for year in selected_year:
-                        if year in data["make_model_year"]:
-                            filtered_year_ids.append(data["PotentialDealID"])
-                            break
-                else:
-                    filtered_year_ids.append(data["PotentialDealID"])
-
-                # Make filter
-                if selected_make:
-                    for make in selected_make:
-                        if make in data["make_model_year"].lower():
-                            filtered_make_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_make_ids.append(data["PotentialDealID"])
-
-                # Model filter
-                if selected_model:
-                    for model in selected_model:
-                        if model in data["make_model_year"].lower():
-                            filtered_model_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_model_ids.append(data["PotentialDealID"])
-
-                # Min odometer filter
-                if min_odometer:
-                    if int(data["odometer"]) >= int(min_odometer):
-                        filtered_min_odometer_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_min_odometer_ids.append(data["PotentialDealID"])
-
-                # Max odometer filter
-                if max_odometer:
-                    if int(data["odometer"]) <= int(max_odometer):
-                        filtered_max_odometer_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_max_odometer_ids.append(data["PotentialDealID"])
-
-                # Min price filter
-                if min_price:
-                    if int(data["price"]) >= int(min_price):
-                        filtered_min_price_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_min_price_ids.append(data["PotentialDealID"])
-
-                # Max price filter
-                if max_price:
-                    if int(data["price"]) <= int(max_price):
-                        filtered_max_price_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_max_price_ids.append(data["PotentialDealID"])
-
-                # Min offer price filter
-                if min_offer_price:
-                    if int(data["OfferPricePctMMR"]) >= int(min_offer_price):
-                        filtered_min_offer_price_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_min_offer_price_ids.append(data["PotentialDealID"])
-
-                # Max offer price filter
-                if max_offer_price:
-                    if int(data["OfferPricePctMMR"]) <= int(max_offer_price):
-                        filtered_max_offer_price_ids.append(data["PotentialDealID"])
-                else:
-                    filtered_max_offer_price_ids.append(data["PotentialDealID"])
-
-            filtered_ids = set(filtered_year_ids).intersection(
-                set(filtered_make_ids),
-                set(filtered_model_ids),
-                set(filtered_min_odometer_ids),
-                set(filtered_max_odometer_ids),
-                set(filtered_min_price_ids),
-                set(filtered_max_price_ids),
-                set(filtered_min_offer_price_ids),
-                set(filtered_max_offer_price_ids)
+    @staticmethod
+    @app.callback(
+        Output(component_id="analytics_content", component_property="children"),
+        [Input(component_id="main_tabs", component_property="active_tab"),
+         Input(component_id="applied_filter", component_property="data")]
+    )
+    def update_analytics(active_tab, criteria):
+        """
+        Charts of the filter applied to the table. Triggered once per Apply by the applied filter
+        store, so the charts never show filter values which were not applied.
+        """
+        if active_tab != "analytics_tab" or criteria is None:
+            raise PreventUpdate
+        # Filtered aggregates are cached, so the filter pass is the only work on a repeated filter
+        version, filtered_records = DBApi.get_instance().get_filtered_records(criteria)
+        snapshot_version, potential_records = DBApi.get_instance().get_snapshot()
+        make_model_index = DBApi.get_instance().load_make_model_index()
+        if snapshot_version != version:
+            # Snapshot reloaded in between
+            aggregates = DealAnalytics.compute_aggregates(
+                DealAnalytics.get_frame(filtered_records, make_model_index)
             )
-            filtered_data = [
-                data
-                for data in potential_deal_db_data
-                if data["PotentialDealID"] in filtered_ids
-            ]
-            return [filtered_data, "", False, 2000]
-        return [potential_deal_db_data, "", False, 2000]
+        else:
+            aggregates = deal_analytics.get_aggregates(
+                version, potential_records, criteria, filtered_records, make_model_index
+            )
+        figures = DealAnalytics.get_figures(aggregates)
+        return [
+            dbc.Label(children=f"{aggregates['no_of_deals']} deals"),
+            dbc.Row(
+                [dbc.Col(dcc.Graph(figure=figure), md=4) for figure in figures[:-1]]
+            ),
+            dcc.Graph(figure=figures[-1]),
+        ]
+
+    @staticmethod
+    @app.callback(
+        Output(component_id="comparables_body", component_property="children"),
+        Input(component_id="comparables_btn", component_property="n_clicks"),
+        [State(component_id="potential_deal_table", component_property="active_cell"),
+         State(component_id="potential_deal_table", component_property="derived_viewport_data")]
+    )
+    def show_comparables(n_clicks, active_cell, derived_viewport_data):
+        """
+        Most similar vehicles of the deal in the active row. The modal is opened and closed by a
+        clientside callback.
+        """
+        if not n_clicks:
+            raise PreventUpdate
+        derived_viewport_data = derived_viewport_data or []
+        if not active_cell or active_cell["row"] >= len(derived_viewport_data):
+            return "Select a cell in the deal row to see its comparables"
+        record = derived_viewport_data[active_cell["row"]]
+        comparables = DBApi.get_instance().get_comparables(record["PotentialDealID"])
+        if not comparables:
+            return f"No comparable vehicles found for {record['make_model_year']}"
+        columns = ["PotentialDealID", "make_model_year", "odometer", "price", "OfferPricePctMMR",
+                   "url", "distance"]
+        return [
+            dbc.Label(
+                children=f"{record['make_model_year']}, odometer {record['odometer']}, "
+                         f"price {record['price']}"
+            ),
+            dash_table.DataTable(
+                columns=[
+                    {"id": x, "name": x, "presentation": "markdown"} if x == "url"
+                    else {"id": x, "name": x}
+                    for x in columns
+                ],
+                data=[{x: data.get(x) for x in columns} for data in comparables],
+                style_table={"overflowX": "auto"},
+                style_header={
+                    "backgroundColor": "rgb(104, 104, 104)",
+                },
+                style_cell={
+                    "backgroundColor": "rgb(48, 48, 48)",
+                    "color": "white",
+                    "textAlign": "center",
+                    "fontSize": "14px",
+                },
+            ),
+        ]
+
+    @staticmethod
+    @app.callback(
+        [Output(component_id="bulk_update_alert", component_property="children"),
+         Output(component_id="bulk_update_alert", component_property="is_open"),
+         Output(component_id="bulk_update_alert", component_property="color"),
+         Output(component_id="bulk_update_alert", component_property="duration"),
+         Output(component_id="bulk_update_done", component_property="data")],
+        Input(component_id="bulk_update_confirm", component_property="submit_n_clicks"),
+        [State(component_id="bulk_update_action", component_property="value"),
+         State(component_id="bulk_update_comment", component_property="value"),
+         State(component_id="bulk_update_done", component_property="data"),
+         State(component_id="applied_filter", component_property="data")]
+    )
+    def bulk_update_filtered_deals(n_clicks, action, comment, bulk_update_done, criteria):
+        """ Set action and/or comment for all the deals matching the applied filter """
+        if not n_clicks:
+            raise PreventUpdate
+        action = action or None
+        comment = comment or None
+        if action is None and comment is None:
+            return ["Select an action or enter a comment", True, "danger", 5000,
+                    bulk_update_done]
+        if criteria is None:
+            return ["Apply a filter first", True, "danger", 5000, bulk_update_done]
+        _, filtered_data = DBApi.get_instance().get_filtered_records(criteria)
+        count = DBApi.get_instance().bulk_update_actions_comments(
+            potential_deal_ids=[data["PotentialDealID"] for data in filtered_data],
+            action=action,
+            comment=comment
+        )
+        return [f"{count} deals updated successfully", True, "success", 5000,
+                bulk_update_done + 1]
 
     @staticmethod
     @app.callback(
@@ -747,18 +884,54 @@ class AppLayout:
             return ["Filter saved successfully", True, "success", 5000, filter_options, ""]
         return ["", False, "success", 5000, filter_options, ""]
 
-    @staticmethod
-    @app.callback(
-        Output(component_id="real_time_interval_output", component_property="children"),
-        Input(component_id="real_time_db_update", component_property="n_intervals")
+
+def show_hide_options(n_clicks, is_open):
+    """ Show or hide the filter options. Server side version of toggle_collapse """
+    if n_clicks:
+        return not is_open
+    return is_open
+
+
+# Show or hide the filter options in the browser itself. Toggling a collapse is purely
+# presentational, so there is no need of a round trip to the server.
+for filter_name in ("year", "make", "model", "odometer", "price", "offer_price"):
+    toggle_dependencies = (
+        Output(component_id=f"{filter_name}_filter_options", component_property="is_open"),
+        Input(component_id=f"{filter_name}_filter_btn", component_property="n_clicks"),
+        State(component_id=f"{filter_name}_filter_options", component_property="is_open")
     )
-    def real_time_db_update(n_intervals):
-        """ Update the potential deal cash in every 15 sec """
-        # Output is just a dummy one as each callback needs an output
-        if n_intervals > 0:
-            # This will refresh self._potential_records in db.py which is used in datatable
-            DBApi.get_instance().get_all_potential_records()
-        return ""
+    if SERVER_SIDE_TOGGLES:
+        app.callback(*toggle_dependencies)(show_hide_options)
+    else:
+        app.clientside_callback(
+            ClientsideFunction(namespace="autocloud", function_name="toggle_collapse"),
+            *toggle_dependencies
+        )
+
+# Opening and closing the comparables modal is presentational too. Only the comparables are loaded
+# from the server.
+app.clientside_callback(
+    ClientsideFunction(namespace="autocloud", function_name="toggle_comparables"),
+    Output(component_id="comparables_modal", component_property="is_open"),
+    [Input(component_id="comparables_btn", component_property="n_clicks"),
+     Input(component_id="comparables_close_btn", component_property="n_clicks")]
+)
+
+# Deal updates pushed from the server are read and merged into the table in the browser, so only
+# the changed rows are sent by the server
+app.clientside_callback(
+    ClientsideFunction(namespace="autocloud", function_name="read_deal_update"),
+    Output(component_id="deal_update_event", component_property="data"),
+    Input(component_id="deal_update_trigger", component_property="n_clicks")
+)
+app.clientside_callback(
+    ClientsideFunction(namespace="autocloud", function_name="apply_deal_updates"),
+    [Output(component_id="potential_deal_table", component_property="data"),
+     Output(component_id="deal_snapshot_version", component_property="data")],
+    [Input(component_id="deal_filtered_store", component_property="data"),
+     Input(component_id="deal_delta_store", component_property="data")],
+    State(component_id="potential_deal_table", component_property="data")
+)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,115 @@
+// Columns edited in the table and saved to db with the Save button
+var AUTOCLOUD_EDITED_COLUMNS = ["Action", "Comment"];
+// Values of the edited columns as last sent by the server, by PotentialDealID
+var autocloudServerValues = {};
+
+// Rows from the server with the values edited in the table but not saved yet. An edit is a value
+// which differs from the one last sent by the server. reset drops the values of the other rows.
+function autocloudKeepEdits(rows, tableData, reset) {
+    var edits = {};
+    (tableData || []).forEach(function(row) {
+        var serverValues = autocloudServerValues[row.PotentialDealID];
+        if (!serverValues) {
+            return;
+        }
+        AUTOCLOUD_EDITED_COLUMNS.forEach(function(column) {
+            if (row[column] !== serverValues[column]) {
+                edits[row.PotentialDealID] = edits[row.PotentialDealID] || {};
+                edits[row.PotentialDealID][column] = row[column];
+            }
+        });
+    });
+    if (reset) {
+        autocloudServerValues = {};
+    }
+    return rows.map(function(row) {
+        var serverValues = {};
+        AUTOCLOUD_EDITED_COLUMNS.forEach(function(column) {
+            serverValues[column] = row[column];
+        });
+        autocloudServerValues[row.PotentialDealID] = serverValues;
+        var edit = edits[row.PotentialDealID];
+        return edit ? Object.assign({}, row, edit) : row;
+    });
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    autocloud: {
+        // Show or hide the filter options
+        toggle_collapse: function(n_clicks, is_open) {
+            if (n_clicks) {
+                return !is_open;
+            }
+            return is_open;
+        },
+
+        // Open the comparables modal with the comparables button and close it with its close
+        // button. The comparables are loaded by a server callback.
+        toggle_comparables: function(open_n_clicks, close_n_clicks) {
+            var triggered = window.dash_clientside.callback_context.triggered.map(
+                function(trigger) { return trigger.prop_id; }
+            );
+            if (triggered.indexOf("comparables_btn.n_clicks") !== -1 && open_n_clicks) {
+                return true;
+            }
+            if (triggered.indexOf("comparables_close_btn.n_clicks") !== -1) {
+                return false;
+            }
+            return window.dash_clientside.no_update;
+        },
+
+        // Last deal update event received from the server
+        read_deal_update: function(n_clicks) {
+            if (!n_clicks || !window.autocloud_deal_update) {
+                return window.dash_clientside.no_update;
+            }
+            return window.autocloud_deal_update;
+        },
+
+        // Replace the table data with the filtered data or merge the changed rows into it.
+        // Unsaved edits of the rows still in the table are kept.
+        apply_deal_updates: function(filtered, delta, table_data) {
+            var no_update = window.dash_clientside.no_update;
+            var triggered = window.dash_clientside.callback_context.triggered.map(
+                function(trigger) { return trigger.prop_id; }
+            );
+            if (triggered.indexOf("deal_delta_store.data") === -1) {
+                if (!filtered) {
+                    return [no_update, no_update];
+                }
+                return [autocloudKeepEdits(filtered.rows, table_data, true), filtered.version];
+            }
+            if (!delta) {
+                return [no_update, no_update];
+            }
+            if (delta.full) {
+                return [autocloudKeepEdits(delta.rows, table_data, true), delta.version];
+            }
+            var changed_rows = autocloudKeepEdits(delta.rows, table_data, false);
+            delta.removed.forEach(function(id) { delete autocloudServerValues[id]; });
+            var dropped = new Set(delta.removed);
+            delta.rows.forEach(function(row) { dropped.add(row.PotentialDealID); });
+            var rows = (table_data || []).filter(function(row) {
+                return !dropped.has(row.PotentialDealID);
+            }).concat(changed_rows);
+            // Same order as the db query
+            rows.sort(function(a, b) { return b.PotentialDealID - a.PotentialDealID; });
+            return [rows, delta.version];
+        }
+    }
+});
+
+// Listen to the deal updates pushed by the server and let dash know by clicking the hidden button
+(function() {
+    if (!window.EventSource) {
+        return;
+    }
+    var source = new EventSource("/deal-updates");
+    source.addEventListener("deals", function(event) {
+        window.autocloud_deal_update = JSON.parse(event.data);
+        var trigger = document.getElementById("deal_update_trigger");
+        if (trigger) {
+            trigger.click();
+        }
+    });
+})();
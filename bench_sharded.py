@@ -0,0 +1,97 @@
+"""
+File:           bench_sharded.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:10 am
+
+Benchmark of the sharded filter, facet and sort on synthetic deals for different no of shards.
+
+Usage:
+    python bench_sharded.py --deals 2000000 --shards 1 2 4 8
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from sharded_store import ShardedDealStore, filter_shard
+
+
+MAKE_MODELS = [
+    "toyota camry", "toyota corolla", "honda civic", "honda accord", "ford f-150", "ford escape",
+    "chevrolet silverado", "nissan altima", "bmw x5", "tesla model 3", "subaru outback",
+]
+
+CRITERIA = [
+    {"make": ["toyota", "honda"], "max_odometer": 80000},
+    {"year": ["2018", "2019", "2020"], "min_price": 10000, "max_price": 40000},
+    {"model": ["model 3"], "max_offer_price": 110},
+    {"min_odometer": 50000, "min_offer_price": 90},
+]
+
+
+def generate_columns(no_of_deals, seed=7):
+    """ Synthetic columns ordered by PotentialDealID DESC """
+    rand = np.random.default_rng(seed)
+    years = rand.integers(2005, 2022, no_of_deals).astype(np.int32)
+    make_models = np.array([x.encode() for x in MAKE_MODELS])[
+        rand.integers(0, len(MAKE_MODELS), no_of_deals)
+    ]
+    make_model_year = np.char.add(np.char.add(years.astype("S4"), b" "), make_models)
+    return {
+        "id": np.arange(no_of_deals, 0, -1).astype(np.float64),
+        "odometer": rand.integers(1000, 250000, no_of_deals).astype(np.float64),
+        "price": rand.integers(2000, 90000, no_of_deals).astype(np.float64),
+        "offer_price": rand.integers(60, 140, no_of_deals).astype(np.float64),
+        "make_model_year": make_model_year,
+        "year": years,
+    }
+
+
+def timeit(func, repeat):
+    """ Median run time in ms """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return statistics.median(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the sharded deal store")
+    parser.add_argument("--deals", type=int, default=2000000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    columns = generate_columns(args.deals)
+    print(f"deals: {args.deals}")
+    print(f"{'shards':>8} {'filter ms':>10} {'facet ms':>10} {'sort ms':>10} {'speedup':>8}")
+
+    # Baseline is the same vectorized filter in a single process without the pool
+    store = ShardedDealStore(1)
+    store.load_columns(columns, version="bench")
+    directory = store.directory
+    baseline = sum(
+        timeit(lambda: filter_shard(directory, 0, args.deals, criteria), args.repeat)
+        for criteria in CRITERIA
+    )
+    store.close()
+    print(f"{'inline':>8} {baseline:>10.1f} {'-':>10} {'-':>10} {1.0:>8.2f}")
+
+    for no_of_shards in args.shards:
+        store = ShardedDealStore(no_of_shards)
+        store.load_columns(columns, version="bench")
+        # Warm up the pool processes and the memory maps
+        store.filter(CRITERIA[0])
+        filter_ms = sum(timeit(lambda: store.filter(criteria), args.repeat) for criteria in CRITERIA)
+        facet_ms = timeit(lambda: store.count_years(CRITERIA[0]), args.repeat)
+        sort_ms = timeit(lambda: store.sort(CRITERIA[3], "price", descending=True), args.repeat)
+        store.close()
+        print(f"{no_of_shards:>8} {filter_ms:>10.1f} {facet_ms:>10.1f} {sort_ms:>10.1f} "
+              f"{baseline / filter_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+File:           bench_startup.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:13 am
+
+Benchmark of the gunicorn start up time and worker memory with and without preload for different
+no of workers. Uses the stand-in database. Worker memory is measured after --filters filter
+requests, as pages shared with the master are copied when requests read the rows.
+
+Usage:
+    python bench_startup.py --workers 1 2 4 8 16 --deals 100000 --filters 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from loadtest import get_free_port, Stats, UserSession
+
+
+def get_pss_mb(pid):
+    """ Proportional set size of the process in MB. Shared pages are split between processes """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as smaps_file:
+            for line in smaps_file:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run_filters(base_url, no_of_filters):
+    """ Apply random filters like users do """
+    session = UserSession(base_url, Stats(), seed=1)
+    for _ in range(no_of_filters):
+        session._filter_values = session.random_filter_values()
+        session.apply_filter()
+
+
+def measure(workers, preload, deals, filters=0, timeout=600):
+    """
+    Return (seconds until all the workers are ready, total pss of the workers in MB after the
+    filter requests)
+    """
+    env = dict(
+        os.environ,
+        AUTOCLOUD_STANDIN_DEALS=str(deals),
+        AUTOCLOUD_PRELOAD="1" if preload else "0",
+    )
+    port = get_free_port()
+    cmd = [
+        sys.executable, "-m", "gunicorn.app.wsgiapp",
+        "--config", "gunicorn.conf.py",
+        "--workers", str(workers),
+        "--bind", f"127.0.0.1:{port}",
+        "--timeout", "600",
+        "--log-level", "info",
+        "standin_db:create_standin_app()",
+    ]
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        stderr=subprocess.PIPE, universal_newlines=True
+    )
+    ready_pids = set()
+    all_ready = threading.Event()
+
+    def read_log():
+        for line in process.stderr:
+            if "Worker ready" in line:
+                ready_pids.add(int(line.split("pid: ")[1].split(")")[0]))
+                if len(ready_pids) >= workers:
+                    all_ready.set()
+
+    reader = threading.Thread(target=read_log, daemon=True)
+    reader.start()
+    try:
+        if not all_ready.wait(timeout):
+            raise RuntimeError(f"{workers} workers were not ready in {timeout} sec")
+        duration = time.perf_counter() - start
+        run_filters(f"http://127.0.0.1:{port}", filters)
+        total_pss = sum(get_pss_mb(pid) for pid in ready_pids)
+    finally:
+        process.terminate()
+        process.wait(timeout=60)
+    return duration, total_pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gunicorn start up with preload")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--deals", type=int, default=100000)
+    parser.add_argument("--filters", type=int, default=100,
+                        help="Filter requests before measuring the worker memory")
+    args = parser.parse_args()
+
+    print(f"deals: {args.deals}, filter requests: {args.filters}")
+    print(f"{'workers':>8} {'startup s':>10} {'preload s':>10} {'pss MB':>10} {'preload pss MB':>15}")
+    for workers in args.workers:
+        duration, pss = measure(workers, preload=False, deals=args.deals, filters=args.filters)
+        preload_duration, preload_pss = measure(
+            workers, preload=True, deals=args.deals, filters=args.filters
+        )
+        print(f"{workers:>8} {duration:>10.2f} {preload_duration:>10.2f} {pss:>10.1f} "
+              f"{preload_pss:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+File:           comparables.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:12 am
+"""
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+
+from filters import split_make_model_year
+
+
+class ComparablesIndex:
+    """
+    Index of the potential deals for comparable vehicle lookup. For each make/model and year, the
+    odometer values are kept in a sorted list, so the nearest vehicles are found using binary
+    search instead of a full scan.
+    """
+    # Comparable vehicles are searched within these many years
+    YEAR_WINDOW = 2
+    # Difference of one year is treated the same as these many miles
+    MILES_PER_YEAR = 12000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {(make, model): {year: ([sorted odometers], [potential deal ids])}}
+        self._groups = defaultdict(dict)
+        # {potential deal id: ((make, model), year, odometer)}
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def get_entry(record):
+        """ Return ((make, model), year, odometer) of the record or None if it can't be indexed """
+        year, make, model = split_make_model_year(record.get("make_model_year"))
+        try:
+            odometer = int(record["odometer"])
+        except (TypeError, ValueError, KeyError):
+            return None
+        if not year or not make:
+            return None
+        return (make.lower(), model.lower()), int(year), odometer
+
+    def _add(self, potential_deal_id, entry):
+        key, year, odometer = entry
+        odometers, potential_deal_ids = self._groups[key].setdefault(year, ([], []))
+        index = bisect_left(odometers, odometer)
+        odometers.insert(index, odometer)
+        potential_deal_ids.insert(index, potential_deal_id)
+        self._entries[potential_deal_id] = entry
+
+    def _remove(self, potential_deal_id):
+        entry = self._entries.pop(potential_deal_id, None)
+        if entry is None:
+            return
+        key, year, odometer = entry
+        odometers, potential_deal_ids = self._groups[key][year]
+        index = bisect_left(odometers, odometer)
+        while potential_deal_ids[index] != potential_deal_id:
+            index += 1
+        del odometers[index]
+        del potential_deal_ids[index]
+        if not odometers:
+            del self._groups[key][year]
+            if not self._groups[key]:
+                del self._groups[key]
+
+    def build(self, potential_records):
+        """ Build the index from all the records """
+        groups = defaultdict(lambda: defaultdict(list))
+        entries = {}
+        for record in potential_records:
+            entry = self.get_entry(record)
+            if entry is None:
+                continue
+            key, year, odometer = entry
+            groups[key][year].append((odometer, record["PotentialDealID"]))
+            entries[record["PotentialDealID"]] = entry
+        sorted_groups = defaultdict(dict)
+        for key, years in groups.items():
+            for year, values in years.items():
+                values.sort()
+                sorted_groups[key][year] = ([x[0] for x in values], [x[1] for x in values])
+        with self._lock:
+            self._groups = sorted_groups
+            self._entries = entries
+
+    def update(self, changed_records, removed_ids):
+        """ Update the index with the changed and removed records of a refresh """
+        with self._lock:
+            for potential_deal_id in removed_ids:
+                self._remove(potential_deal_id)
+            for record in changed_records:
+                potential_deal_id = record["PotentialDealID"]
+                self._remove(potential_deal_id)
+                entry = self.get_entry(record)
+                if entry is not None:
+                    self._add(potential_deal_id, entry)
+
+    def find(self, potential_deal_id, k=10):
+        """ Return list of (distance, potential deal id) of the k nearest comparable vehicles """
+        with self._lock:
+            entry = self._entries.get(potential_deal_id)
+            if entry is None:
+                return []
+            key, year, odometer = entry
+            candidates = []
+            for other_year in range(year - ComparablesIndex.YEAR_WINDOW,
+                                    year + ComparablesIndex.YEAR_WINDOW + 1):
+                values = self._groups.get(key, {}).get(other_year)
+                if values is None:
+                    continue
+                year_distance = abs(other_year - year) * ComparablesIndex.MILES_PER_YEAR
+                candidates.extend(
+                    (year_distance + odometer_distance, other_id)
+                    for odometer_distance, other_id in self._nearest(
+                        values, odometer, k + 1, potential_deal_id
+                    )
+                )
+        candidates.sort()
+        return candidates[:k]
+
+    @staticmethod
+    def _nearest(values, odometer, k, excluded_id):
+        """ k nearest (odometer distance, id) expanding both sides of the odometer position """
+        odometers, potential_deal_ids = values
+        right = bisect_left(odometers, odometer)
+        left = right - 1
+        results = []
+        while len(results) < k and (left >= 0 or right < len(odometers)):
+            left_distance = odometer - odometers[left] if left >= 0 else None
+            right_distance = odometers[right] - odometer if right < len(odometers) else None
+            if right_distance is None or (left_distance is not None and
+                                          left_distance <= right_distance):
+                index, distance = left, left_distance
+                left -= 1
+            else:
+                index, distance = right, right_distance
+                right += 1
+            if potential_deal_ids[index] != excluded_id:
+                results.append((distance, potential_deal_ids[index]))
+        return results
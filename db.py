@@ -4,16 +4,31 @@ Author:         Dibyaranjan Sathua
 Created on:     20/02/21, 1:49 am
 """
 from typing import Optional
+import os
 import re
+import threading
+import time
 from collections import defaultdict
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text, bindparam
 from config import DBCred
+from make_model_index import MakeModelIndex
+from snapshot import DealChangeLog
+from singleflight import singleflight
+from filters import get_filter_key, is_filter_applied, filter_potential_records
+from sharded_store import ShardedDealStore, DealColumns
+from comparables import ComparablesIndex
+from query_log import query_log
+from diagnostics import memory_diagnostics
 
 
 class DBApi:
     """ Class responsible for db operatons """
     __instance = None
     DB_URL = f"mysql+pymysql://{DBCred.USERNAME}:{DBCred.PASSWORD}@{DBCred.HOST}/{DBCred.DBNAME}"
+    # No of ids in the IN clause of a single bulk UPDATE statement
+    BULK_UPDATE_CHUNK_SIZE = 1000
+    # Seconds after which the cached snapshot is checked against db when it is read
+    SNAPSHOT_MAX_AGE = int(os.environ.get("AUTOCLOUD_DEAL_POLL_INTERVAL", 30))
 
     @classmethod
     def get_instance(cls):
@@ -22,33 +37,271 @@ class DBApi:
             cls.__instance = DBApi()
         return cls.__instance
 
+    @classmethod
+    def set_instance(cls, instance):
+        """ Replace the DBApi instance. Used to run the app against a stand-in database """
+        cls.__instance = instance
+
     def __init__(self):
         self._engine = create_engine(DBApi.DB_URL)
         self._conn = self._engine.connect()
-        self._potential_records = None
-        self._filters = None
+        self._init_cache()
 
     def __del__(self):
         self._conn.close()
 
-    def get_all_potential_records(self):
-        """ Get all potential deals data """
+    def close_before_fork(self):
+        """
+        Close the db connections in gunicorn master before forking the workers. Forked workers
+        must not share the sockets of the master.
+        """
+        if self._engine is None:
+            return
+        self._conn.close()
+        self._engine.dispose()
+
+    def reconnect_after_fork(self):
+        """ Create a new engine and connection in the forked worker """
+        if self._engine is None:
+            return
+        self._engine = create_engine(DBApi.DB_URL)
+        self._conn = self._engine.connect()
+
+    def _init_cache(self):
+        """ Initialize the cached data """
+        self._potential_records = None
+        self._potential_records_by_id = {}
+        self._snapshot_version = None
+        self._snapshot_columns = None
+        self._snapshot_lock = threading.Lock()
+        # Checksum of vw_Deal for the cached snapshot and when it was last compared with db
+        self._snapshot_checksum = None
+        self._snapshot_checked_at = None
+        self._checksum_query = None
+        self._change_log = DealChangeLog()
+        self._comparables_index = ComparablesIndex()
+        # Optional process pool for filtering millions of deals
+        self._sharded_store = None
+        if ShardedDealStore.is_enabled():
+            self._sharded_store = ShardedDealStore(ShardedDealStore.NO_OF_SHARDS)
+        self._filters = None
+        self._make_model_index = None
+        memory_diagnostics.register_cache("deals", lambda: self._potential_records)
+        memory_diagnostics.register_cache("deals_by_id", lambda: self._potential_records_by_id)
+        memory_diagnostics.register_cache("deal_change_log", lambda: self._change_log)
+        memory_diagnostics.register_cache("comparables", lambda: self._comparables_index)
+        memory_diagnostics.register_cache("filters", lambda: self._filters)
+        memory_diagnostics.register_cache("make_model", lambda: self._make_model_index)
+
+    @staticmethod
+    def _execute(conn, query, fetch=False, **params):
+        """ Execute the query and record its duration, rows and size in the query log """
+        return query_log.execute(conn, query, fetch=fetch, **params)
+
+    def _query_potential_records(self):
+        """ Query all the rows of vw_Deal """
         with self._engine.connect() as conn:
             query = "SELECT * FROM vw_Deal ORDER BY PotentialDealID DESC"
-            self._potential_records = [dict(row) for row in conn.execute(query).fetchall()]
-        return self._potential_records
+            return [dict(row) for row in self._execute(conn, query, fetch=True)]
+
+    def _query_potential_records_checksum(self):
+        """ Checksum of vw_Deal. Rows are aggregated in db, so only a single row is sent back """
+        if self._checksum_query is None:
+            columns = ", ".join(f"`{column}`" for column in self.get_potential_deal_columns())
+            self._checksum_query = f"SELECT COUNT(*), SUM(CRC32(CONCAT_WS('|', {columns}))) " \
+                                   f"FROM vw_Deal"
+        with self._engine.connect() as conn:
+            row = self._execute(conn, self._checksum_query, fetch=True)[0]
+        return tuple(str(value) for value in row)
+
+    def get_all_potential_records(self, checksum=None, checked_at=None):
+        """ Get all potential deals data """
+        # Concurrent reloads share a single query. Every load is recorded, whichever path
+        # started it.
+        return singleflight.do(
+            ("potential_records_load", id(self)), memory_diagnostics.record_cycle, "deal_reload",
+            self._load_potential_records, checksum, checked_at
+        )
+
+    def _load_potential_records(self, checksum=None, checked_at=None):
+        """
+        Query all potential deals and replace the cached snapshot. checksum is the vw_Deal
+        checksum queried at checked_at, if it is already known.
+        """
+        if checksum is None:
+            checked_at = time.time()
+            checksum = self._query_potential_records_checksum()
+        potential_records = self._query_potential_records()
+        # Add markdown for url
+        for data in potential_records:
+            data["url"] = f"[Link]({data['url']})"
+        # Everything is computed before taking the snapshot lock, so readers are only blocked
+        # while the references are swapped. Loads don't overlap as they run in singleflight.
+        columns = DealColumns(potential_records)
+        potential_records_by_id = {data["PotentialDealID"]: data for data in potential_records}
+        change_log_update = self._change_log.prepare(potential_records)
+        previous_version, version, changed_ids, removed_ids, _ = change_log_update
+        # Comparables index is built on the first load and updated incrementally after that
+        comparables_index = self._comparables_index
+        if previous_version is None:
+            comparables_index = ComparablesIndex()
+            comparables_index.build(potential_records)
+        elif version != previous_version:
+            comparables_index.update(
+                [potential_records_by_id[x] for x in changed_ids], removed_ids
+            )
+        with self._snapshot_lock:
+            self._change_log.commit(change_log_update)
+            self._potential_records = potential_records
+            self._snapshot_columns = columns
+            self._potential_records_by_id = potential_records_by_id
+            self._snapshot_version = version
+            self._snapshot_checksum = checksum
+            self._snapshot_checked_at = checked_at
+            self._comparables_index = comparables_index
+        return potential_records
+
+    def reload_if_changed(self):
+        """
+        Reload the snapshot only if the vw_Deal checksum changed since the last load. Concurrent
+        checks share a single query.
+        """
+        singleflight.do(("snapshot_check", id(self)), self._reload_if_changed)
+
+    def _reload_if_changed(self):
+        """ Compare the vw_Deal checksum with the one of the cached snapshot """
+        checked_at = time.time()
+        checksum = self._query_potential_records_checksum()
+        if self._potential_records is not None and checksum == self._snapshot_checksum:
+            with self._snapshot_lock:
+                self._snapshot_checked_at = checked_at
+            return
+        self.get_all_potential_records(checksum, checked_at)
+
+    def refresh_snapshot(self, since):
+        """ Make sure the snapshot was checked against db at or after since (a timestamp) """
+        # A check already in flight may have started before since. The second one starts after.
+        for _ in range(2):
+            if self._snapshot_checked_at is not None and self._snapshot_checked_at >= since:
+                return
+            self.reload_if_changed()
+
+    def get_snapshot(self):
+        """ Return (version, potential records) of the cached snapshot """
+        if self._potential_records is None:
+            self.get_all_potential_records()
+        elif time.time() - self._snapshot_checked_at >= DBApi.SNAPSHOT_MAX_AGE:
+            # Workers only poll while browsers listen to their deal updates. So the snapshot is
+            # also checked on read, at most once per SNAPSHOT_MAX_AGE.
+            self.reload_if_changed()
+        with self._snapshot_lock:
+            return self._snapshot_version, self._potential_records
+
+    def get_changes_since(self, version):
+        """
+        Return (current version, changed records, removed ids) of the cached snapshot since the
+        version. Return None if the changes are not known and a full reload is needed.
+        """
+        with self._snapshot_lock:
+            changes = self._change_log.get_changes_since(version)
+            if changes is None:
+                return None
+            changed_ids, removed_ids = changes
+            changed_records = [
+                self._potential_records_by_id[potential_deal_id]
+                for potential_deal_id in changed_ids
+                if potential_deal_id in self._potential_records_by_id
+            ]
+            return self._snapshot_version, changed_records, removed_ids
+
+    def get_filtered_records(self, criteria):
+        """
+        Return (version, potential records matching the filter criteria) of the cached snapshot.
+        Identical filters running at the same time on the same snapshot share a single pass.
+        """
+        version, potential_records = self.get_snapshot()
+        columns = self._get_snapshot_columns(version)
+        key = ("filter", id(self), version, get_filter_key(criteria))
+        if self._sharded_store is not None:
+            filtered_records = singleflight.do(
+                key, self._filter_sharded, version, potential_records, columns, criteria
+            )
+        else:
+            filtered_records = singleflight.do(
+                key, self._filter_columns, potential_records, columns, criteria
+            )
+        return version, filtered_records
+
+    def _get_snapshot_columns(self, version):
+        """ Numpy columns of the cached snapshot. None if the snapshot is not the version anymore """
+        with self._snapshot_lock:
+            return self._snapshot_columns if self._snapshot_version == version else None
+
+    @staticmethod
+    def _filter_columns(potential_records, columns, criteria):
+        """ Filter on the numpy columns of the snapshot. Only the matching rows are read """
+        if not is_filter_applied(criteria):
+            return potential_records
+        if columns is None:
+            # Snapshot reloaded in between
+            return filter_potential_records(potential_records, criteria)
+        return [potential_records[position] for position in columns.filter(criteria).tolist()]
+
+    def _load_sharded_store(self, version, columns):
+        """ Load the snapshot columns to the sharded store once per version """
+        if version != self._sharded_store.version:
+            singleflight.do(
+                ("shard_load", id(self), version), self._sharded_store.load_columns,
+                columns.arrays, version
+            )
+
+    def _filter_sharded(self, version, potential_records, columns, criteria):
+        """ Filter using the process pool of the sharded store """
+        if not is_filter_applied(criteria):
+            return potential_records
+        if columns is None:
+            return filter_potential_records(potential_records, criteria)
+        self._load_sharded_store(version, columns)
+        shard_version, positions = self._sharded_store.filter(criteria)
+        if shard_version != version:
+            # Sharded store moved to a newer snapshot in between
+            return self._filter_columns(potential_records, columns, criteria)
+        return [potential_records[position] for position in positions.tolist()]
+
+    def get_comparables(self, potential_deal_id, k=10):
+        """ Return the k most similar deals with their distance added as "distance" key """
+        self.get_snapshot()
+        comparables = []
+        for distance, comparable_id in self._comparables_index.find(potential_deal_id, k=k):
+            data = self._potential_records_by_id.get(comparable_id)
+            if data is not None:
+                comparables.append({**data, "distance": distance})
+        return comparables
 
     def get_potential_deal_columns(self):
         """ Get potential deal column name """
         with self._engine.connect() as conn:
             query = "SELECT COLUMN_NAME FROM INFORMATION_SCHEMA.COLUMNS WHERE " \
                     "TABLE_NAME = 'vw_Deal' ORDER BY ORDINAL_POSITION"
-            return [x[0] for x in conn.execute(query).fetchall()]
+            return [x[0] for x in self._execute(conn, query, fetch=True)]
 
     def get_unique_years(self, potential_records: Optional[dict] = None):
         """ Extract year and no of vehicle in that year """
         if potential_records is None:
-            potential_records = self.get_all_potential_records()
+            version, potential_records = self.get_snapshot()
+            columns = self._get_snapshot_columns(version)
+            if columns is not None:
+                # Vectorized count on the columns. The process pool of the sharded store is not
+                # used, so it is never started in the gunicorn master during preload.
+                return columns.count_years()
+            return singleflight.do(
+                ("unique_years", id(self), version), self._count_years, potential_records
+            )
+        return self._count_years(potential_records)
+
+    @staticmethod
+    def _count_years(potential_records):
+        """ No of vehicles for each year """
         make_model_year_col = [record["make_model_year"] for record in potential_records]
         years = defaultdict(int)
         year_regex = re.compile(r"^\s*(\d+)")
@@ -64,12 +317,22 @@ class DBApi:
         """ Get all the rows for make_model columns """
         with self._engine.connect() as conn:
             query = "SELECT * FROM vauto_make_model"
-            make_model_records = [dict(row) for row in conn.execute(query).fetchall()]
+            make_model_records = [dict(row) for row in self._execute(conn, query, fetch=True)]
         make_model = defaultdict(list)
         for record in make_model_records:
             make_model[record["make"]].append(record["model"])
         return make_model
 
+    def load_make_model_index(self):
+        """ Build the make model prefix index once and return it """
+        # vauto_make_model is static. So the index is built only once
+        if self._make_model_index is None:
+            self._make_model_index = singleflight.do(
+                ("make_model_load", id(self)),
+                lambda: MakeModelIndex(self.get_all_make_models())
+            )
+        return self._make_model_index
+
     def save_actions_comments(self, records):
         """ Save action and comments to db """
         # records is a list of dict with id, Action and Comment
@@ -96,9 +359,37 @@ class DBApi:
             """
         with self._engine.connect() as conn:
             transcation = conn.begin()
-            conn.execute(query)
+            self._execute(conn, query)
             transcation.commit()
 
+    def bulk_update_actions_comments(self, potential_deal_ids, action=None, comment=None):
+        """ Set action and/or comment for all the potential deal ids """
+        columns = {}
+        if action is not None:
+            columns["Action"] = action
+        if comment is not None:
+            columns["Comment"] = comment
+        potential_deal_ids = list(potential_deal_ids)
+        if not columns or not potential_deal_ids:
+            return 0
+        # Set based update with one statement per chunk instead of one statement per row
+        set_clause = ", ".join(f"{column} = :{column}" for column in columns)
+        query = text(
+            f"UPDATE PotentialDeal SET {set_clause} WHERE PotentialDealID IN :ids"
+        ).bindparams(bindparam("ids", expanding=True))
+        with self._engine.connect() as conn:
+            transcation = conn.begin()
+            for start in range(0, len(potential_deal_ids), DBApi.BULK_UPDATE_CHUNK_SIZE):
+                chunk = potential_deal_ids[start:start + DBApi.BULK_UPDATE_CHUNK_SIZE]
+                self._execute(conn, query, ids=chunk, **columns)
+            transcation.commit()
+        # Patch the cached records in place so that we don't need to reload all data from db
+        for potential_deal_id in potential_deal_ids:
+            record = self._potential_records_by_id.get(potential_deal_id)
+            if record is not None:
+                record.update(columns)
+        return len(potential_deal_ids)
+
     def save_filter(self, name, year, make, model, min_odometer, max_odometer, min_price, max_price,
                     min_offer_price, max_offer_price):
         """ Save the filter for future use """
@@ -110,14 +401,14 @@ class DBApi:
         """
         with self._engine.connect() as conn:
             transcation = conn.begin()
-            conn.execute(query)
+            self._execute(conn, query)
             transcation.commit()
 
     def get_all_filters(self):
         """ Get all the rows for filters """
         with self._engine.connect() as conn:
             query = "SELECT * FROM Filters"
-            self._filters = [dict(row) for row in conn.execute(query).fetchall()]
+            self._filters = [dict(row) for row in self._execute(conn, query, fetch=True)]
         return self._filters
 
     @property
@@ -128,12 +419,20 @@ class DBApi:
         print("Returning data from cache")
         return self._potential_records
 
+    @property
+    def snapshot_version(self):
+        return self._snapshot_version
+
     @property
     def filters(self):
         if self._filters is None:
             self.get_all_filters()
         return self._filters
 
+    @property
+    def make_model_index(self):
+        return self.load_make_model_index()
+
 
 if __name__ == "__main__":
     db_api = DBApi()
@@ -0,0 +1,166 @@
+"""
+File:           deal_updates.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:08 am
+"""
+import json
+import os
+import queue
+import threading
+import time
+
+import flask
+
+from db import DBApi
+
+
+class DealUpdateNotifier:
+    """
+    Check the potential deals in db from a background thread while browsers are listening and
+    push the new snapshot version with the changed row ids to them using server sent events.
+    There is one notifier per worker process, so db is polled once per worker instead of once per
+    browser tab.
+    """
+    # Seconds between two db reloads
+    POLL_INTERVAL = int(os.environ.get("AUTOCLOUD_DEAL_POLL_INTERVAL", 30))
+    # Seconds between keep alive comments on the event stream
+    KEEP_ALIVE_INTERVAL = 15
+    # An event stream is closed after this many seconds and the browser reconnects. This way a
+    # worker thread is not held forever by a single tab.
+    MAX_STREAM_DURATION = 600
+    # Threads of a gthread worker kept free for the dash callbacks
+    RESERVED_THREADS = int(os.environ.get("AUTOCLOUD_STREAM_RESERVED_THREADS", 4))
+    # Browsers over the stream limit reconnect after this many milliseconds
+    OVER_LIMIT_RETRY_MS = 30000
+    # Only the version is sent when more rows changed than this
+    MAX_EVENT_IDS = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._thread = None
+        self._pid = None
+        # Max no of open streams of this worker. None is no limit. Set by gunicorn.conf.py from
+        # the worker class and threads.
+        self.max_streams = None
+
+    def ensure_started(self):
+        """ Start the poll thread. Threads don't survive fork, so it is started in each worker """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._subscribers = set()
+            self._thread = threading.Thread(
+                target=self._poll, name="deal-update-notifier", daemon=True
+            )
+            self._thread.start()
+
+    def has_subscribers(self):
+        with self._lock:
+            return bool(self._subscribers)
+
+    def _poll(self):
+        """ Reload the deals from db and notify the subscribers if the snapshot changed """
+        while True:
+            time.sleep(DealUpdateNotifier.POLL_INTERVAL)
+            if not self.has_subscribers():
+                # Nobody to notify. Requests check the age of the snapshot themselves.
+                continue
+            db_api = DBApi.get_instance()
+            previous_version = db_api.snapshot_version
+            try:
+                # Full reload only if the checksum of vw_Deal changed
+                db_api.reload_if_changed()
+            except Exception as err:
+                print(f"Error while reloading potential deals: {err}")
+                continue
+            changes = db_api.get_changes_since(previous_version)
+            if changes is None or changes[0] == previous_version:
+                continue
+            version, changed_records, removed_ids = changes
+            changed_ids = [data["PotentialDealID"] for data in changed_records]
+            event = {"version": version, "previous_version": previous_version}
+            if len(changed_ids) + len(removed_ids) <= DealUpdateNotifier.MAX_EVENT_IDS:
+                event["changed"] = changed_ids
+                event["removed"] = list(removed_ids)
+            self.publish(event)
+
+    def publish(self, event):
+        """ Send the event to all the subscribers """
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(event)
+
+    @staticmethod
+    def format_event(event):
+        """ Server sent event. Version is the event id, so a reconnecting browser sends it back """
+        return f"id: {event['version']}\nevent: deals\ndata: {json.dumps(event, default=str)}\n\n"
+
+    @staticmethod
+    def get_opening_messages(retry_ms, last_event_id):
+        """
+        Reconnect delay and the current version at the start of a stream. A reconnecting browser
+        which missed updates while disconnected gets an event right away. Otherwise only the event
+        id is set, so that the browser sends the version back when it reconnects.
+        """
+        messages = f"retry: {retry_ms}\n\n"
+        version = DBApi.get_instance().snapshot_version
+        if version is None or version == last_event_id:
+            return messages
+        if last_event_id:
+            event = {"version": version, "previous_version": last_event_id}
+            return messages + DealUpdateNotifier.format_event(event)
+        return messages + f"id: {version}\n\n"
+
+    def stream(self, last_event_id=None):
+        """ Generator of server sent events for a single browser tab """
+        subscriber = queue.Queue()
+        with self._lock:
+            is_over_limit = (
+                self.max_streams is not None and len(self._subscribers) >= self.max_streams
+            )
+            if not is_over_limit:
+                self._subscribers.add(subscriber)
+        if is_over_limit:
+            # No thread left for a long lived stream. Browser gets the missed update now and
+            # reconnects later, i.e. it polls slowly instead of taking the callback threads.
+            yield self.get_opening_messages(DealUpdateNotifier.OVER_LIMIT_RETRY_MS, last_event_id)
+            return
+        try:
+            # Browser reconnects after 5 sec if the stream is closed
+            yield self.get_opening_messages(5000, last_event_id)
+            start = time.time()
+            while time.time() - start < DealUpdateNotifier.MAX_STREAM_DURATION:
+                try:
+                    event = subscriber.get(timeout=DealUpdateNotifier.KEEP_ALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield self.format_event(event)
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+notifier = DealUpdateNotifier()
+
+
+def register_deal_update_routes(server):
+    """ Add the server sent event endpoint to the flask server """
+
+    @server.before_first_request
+    def start_notifier():
+        notifier.ensure_started()
+
+    @server.route("/deal-updates")
+    def deal_updates():
+        notifier.ensure_started()
+        return flask.Response(
+            flask.stream_with_context(
+                notifier.stream(last_event_id=flask.request.headers.get("Last-Event-ID"))
+            ),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
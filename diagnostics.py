@@ -0,0 +1,184 @@
+"""
+File:           diagnostics.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:15 am
+"""
+import gc
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+
+
+class MemoryDiagnostics:
+    """
+    Opt-in memory diagnostics of the worker. RSS, tracemalloc top allocations, size of each cache
+    and the memory deltas of each deal reload cycle.
+    """
+    ENABLED = os.environ.get("AUTOCLOUD_MEMORY_DIAGNOSTICS", "0") == "1"
+    # No of frames stored by tracemalloc for each allocation
+    TRACEMALLOC_FRAMES = 5
+    # No of reload cycles kept
+    MAX_CYCLES = 50
+    # Containers with more items than this are measured from a sample of their items
+    SAMPLE_ITEMS = 100
+    # Objects which are not part of a cache
+    SKIPPED_TYPES = (
+        type, types.ModuleType, types.FunctionType, types.MethodType, types.BuiltinFunctionType,
+        type(threading.Lock()), threading.Thread,
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches = {}
+        self._cycles = deque(maxlen=MemoryDiagnostics.MAX_CYCLES)
+
+    def start(self):
+        """ Start tracing the allocations """
+        if MemoryDiagnostics.ENABLED and not tracemalloc.is_tracing():
+            tracemalloc.start(MemoryDiagnostics.TRACEMALLOC_FRAMES)
+
+    def register_cache(self, name, getter):
+        """ Register a function returning the cached object to be measured """
+        with self._lock:
+            self._caches[name] = getter
+
+    @staticmethod
+    def get_rss_mb():
+        """ Current resident set size in MB. Falls back to max rss if /proc is not available """
+        try:
+            with open("/proc/self/status") as status_file:
+                for line in status_file:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        # ru_maxrss is in KB on linux and bytes on mac
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+    @staticmethod
+    def get_sample(items, no_of_items):
+        """ Return (evenly spaced sample of the items, no of items each sampled item stands for) """
+        if no_of_items <= MemoryDiagnostics.SAMPLE_ITEMS:
+            return list(items), 1
+        step = no_of_items // MemoryDiagnostics.SAMPLE_ITEMS
+        sample = list(itertools.islice(items, 0, None, step))
+        return sample, no_of_items / len(sample)
+
+    @staticmethod
+    def get_deep_size(obj, seen=None):
+        """
+        Return the estimated (no of objects, bytes) reachable from obj. Items of large containers
+        are sampled and scaled by the no of items, so the deals are not walked row by row inside
+        the request. Objects with their id in seen are not counted again.
+        """
+        seen = set() if seen is None else seen
+        # (object, no of objects it stands for)
+        stack = [(obj, 1)]
+        no_of_objects = 0
+        size = 0
+        while stack:
+            current, weight = stack.pop()
+            if id(current) in seen or isinstance(current, MemoryDiagnostics.SKIPPED_TYPES):
+                continue
+            seen.add(id(current))
+            no_of_objects += weight
+            size += weight * sys.getsizeof(current)
+            if isinstance(current, dict):
+                sample, scale = MemoryDiagnostics.get_sample(current.items(), len(current))
+                stack.extend((x, weight * scale) for item in sample for x in item)
+            elif isinstance(current, (list, tuple, set, frozenset, deque)):
+                sample, scale = MemoryDiagnostics.get_sample(current, len(current))
+                stack.extend((x, weight * scale) for x in sample)
+            elif hasattr(current, "__dict__"):
+                # Instance attributes of the cache classes. pandas and numpy objects already
+                # report their full size from sys.getsizeof
+                if type(current).__module__.split(".")[0] not in ("pandas", "numpy"):
+                    stack.append((vars(current), weight))
+        return int(no_of_objects), int(size)
+
+    def get_cache_sizes(self):
+        """
+        Objects and bytes of each registered cache. Objects shared by caches, like the deal rows
+        of deals and deals_by_id, are counted only in the first registered one, so the sizes add
+        up.
+        """
+        with self._lock:
+            caches = dict(self._caches)
+        sizes = {}
+        seen = set()
+        for name, getter in caches.items():
+            no_of_objects, size = self.get_deep_size(getter(), seen=seen)
+            sizes[name] = {"objects": no_of_objects, "mb": round(size / (1024 * 1024), 3)}
+        return sizes
+
+    @staticmethod
+    def get_top_allocations(limit=20):
+        """ Top allocations by line from tracemalloc """
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ])
+        return [
+            {
+                "location": str(stat.traceback[0]),
+                "mb": round(stat.size / (1024 * 1024), 3),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+    def record_cycle(self, name, func, *args, **kwargs):
+        """ Run func and record the rss and traced memory delta. Only when enabled """
+        if not MemoryDiagnostics.ENABLED:
+            return func(*args, **kwargs)
+        rss_before = self.get_rss_mb()
+        traced_before = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            traced_after = tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0
+            rss_after = self.get_rss_mb()
+            with self._lock:
+                self._cycles.append({
+                    "name": name,
+                    "time": time.time(),
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                    "rss_mb": round(rss_after, 3),
+                    "rss_delta_mb": round(rss_after - rss_before, 3),
+                    "traced_delta_mb": round((traced_after - traced_before) / (1024 * 1024), 3),
+                })
+
+    def stats(self, limit=20):
+        """ Full memory report of the worker """
+        with self._lock:
+            cycles = list(self._cycles)
+        traced_current, traced_peak = (
+            tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        )
+        return {
+            "enabled": MemoryDiagnostics.ENABLED,
+            "rss_mb": round(self.get_rss_mb(), 3),
+            "traced_mb": round(traced_current / (1024 * 1024), 3),
+            "traced_peak_mb": round(traced_peak / (1024 * 1024), 3),
+            # Objects are not listed as it stalls the worker with millions of them
+            "gc_counts": gc.get_count(),
+            "gc_frozen_objects": gc.get_freeze_count(),
+            "caches": self.get_cache_sizes(),
+            "top_allocations": self.get_top_allocations(limit=limit),
+            "reload_cycles": cycles,
+        }
+
+
+# Shared by the whole process
+memory_diagnostics = MemoryDiagnostics()
+memory_diagnostics.start()
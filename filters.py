@@ -0,0 +1,109 @@
+"""
+File:           filters.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:04 am
+"""
+import re
+from typing import Optional
+
+
+# Order of the filter fields. Same as the columns of Filters table and the order of the filter
+# states in the callbacks.
+FILTER_FIELDS = (
+    "year", "make", "model", "min_odometer", "max_odometer", "min_price", "max_price",
+    "min_offer_price", "max_offer_price"
+)
+
+MAKE_MODEL_YEAR_REGEX = re.compile(r"^\s*(\d+)\s+(\S+)\s*(.*)$")
+
+
+def split_make_model_year(make_model_year, make_model_index=None):
+    """
+    Return (year, make, model) from make_model_year column. Missing parts are empty. Without the
+    make model index, make is the first word after the year.
+    """
+    match_obj = MAKE_MODEL_YEAR_REGEX.search(make_model_year or "")
+    if match_obj is None:
+        return "", "", ""
+    year, make, model = match_obj.group(1), match_obj.group(2), match_obj.group(3).strip()
+    if make_model_index is not None:
+        make, model = make_model_index.split_make_model(f"{make} {model}")
+    return year, make, model
+
+
+def get_filter_criteria(*filter_values):
+    """ Return the filter criteria dict from the filter values in FILTER_FIELDS order """
+    return dict(zip(FILTER_FIELDS, filter_values))
+
+
+def get_filter_key(criteria):
+    """ Hashable key of the filter criteria. Used to identify identical filters """
+    key = []
+    for field in FILTER_FIELDS:
+        value = criteria.get(field)
+        if isinstance(value, (list, tuple)):
+            key.append(tuple(sorted(str(x) for x in value if x)))
+        else:
+            key.append(str(value) if value else "")
+    return tuple(key)
+
+
+def get_filter_needles(criteria, field):
+    """ Lower case search strings of the year, make or model filter. Empty values are ignored """
+    return [str(value).lower() for value in criteria.get(field) or [] if value]
+
+
+def is_filter_applied(criteria):
+    """ Check if any of the filter is selected """
+    return any(criteria.get(field) for field in FILTER_FIELDS)
+
+
+def validate_filter_criteria(criteria) -> Optional[str]:
+    """ Return the error message if the min and max values are not valid else None """
+    ranges = (
+        ("min_odometer", "max_odometer",
+         "Max odometer value should be greater than min odometer value"),
+        ("min_price", "max_price",
+         "Max price value should be greater than min price value"),
+        ("min_offer_price", "max_offer_price",
+         "Max offer price MMR value should be greater than min offer price MMR value"),
+    )
+    for min_field, max_field, error in ranges:
+        min_value = criteria.get(min_field)
+        max_value = criteria.get(max_field)
+        if min_value and max_value:
+            if int(max_value) < int(min_value):
+                return error
+    return None
+
+
+def is_matching_record(data, criteria):
+    """ Check if a potential deal record satisfy all the filter criteria """
+    make_model_year = (data["make_model_year"] or "").lower()
+    # Year, make and model filters
+    for field in ("year", "make", "model"):
+        needles = get_filter_needles(criteria, field)
+        if needles and not any(needle in make_model_year for needle in needles):
+            return False
+    # Odometer, price and offer price filters
+    bounds = (
+        ("odometer", criteria.get("min_odometer"), criteria.get("max_odometer")),
+        ("price", criteria.get("min_price"), criteria.get("max_price")),
+        ("OfferPricePctMMR", criteria.get("min_offer_price"), criteria.get("max_offer_price")),
+    )
+    for column, min_value, max_value in bounds:
+        if (min_value or max_value) and data[column] is None:
+            # Missing value doesn't satisfy any bound
+            return False
+        if min_value and int(data[column]) < int(min_value):
+            return False
+        if max_value and int(data[column]) > int(max_value):
+            return False
+    return True
+
+
+def filter_potential_records(potential_records, criteria):
+    """ Return the potential records matching the filter criteria. Order of the records is kept """
+    if not is_filter_applied(criteria):
+        return potential_records
+    return [data for data in potential_records if is_matching_record(data, criteria)]
@@ -0,0 +1,62 @@
+"""
+File:           gunicorn.conf.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:13 am
+
+Gunicorn config. Set AUTOCLOUD_PRELOAD=1 to import the app and load the data once in the master
+process and fork the workers from it.
+
+Usage:
+    gunicorn --config gunicorn.conf.py --workers 4 "wsgi:create_app()"
+"""
+import gc
+import os
+import time
+
+
+preload_app = os.environ.get("AUTOCLOUD_PRELOAD", "0") == "1"
+
+# Each open /deal-updates stream holds a thread of the worker. The sync worker would stop sending
+# heartbeats while streaming and get killed by the timeout. So threads are used and the no of
+# streams of a worker is limited to the threads minus DealUpdateNotifier.RESERVED_THREADS.
+# Set AUTOCLOUD_WORKER_CLASS=gevent for many open tabs per worker.
+worker_class = os.environ.get("AUTOCLOUD_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("AUTOCLOUD_THREADS", 32))
+
+if preload_app:
+    # No garbage collection while loading the data in master. Collection passes write to the gc
+    # header of every tracked object, which would copy the shared pages in the workers.
+    gc.disable()
+
+
+def pre_fork(server, worker):
+    """ Called in master before forking each worker """
+    if not preload_app:
+        return
+    from db import DBApi
+    DBApi.get_instance().close_before_fork()
+    # Move all the loaded objects to the permanent generation so that the gc of the workers
+    # never touch them. Refcount updates still copy the pages of the objects a request reads, so
+    # the filters read the numpy columns of the snapshot (sharded_store.DealColumns) instead of
+    # every row dict.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    """ Called in the worker after fork """
+    if not preload_app:
+        return
+    gc.enable()
+    from db import DBApi
+    DBApi.get_instance().reconnect_after_fork()
+
+
+def post_worker_init(worker):
+    """ Called when the worker has loaded the app and is ready to serve """
+    from deal_updates import notifier, DealUpdateNotifier
+    worker_class = worker.cfg.worker_class_str
+    if worker_class == "sync":
+        notifier.max_streams = 0
+    elif worker_class == "gthread":
+        notifier.max_streams = max(0, worker.cfg.threads - DealUpdateNotifier.RESERVED_THREADS)
+    worker.log.info("Worker ready (pid: %s) at %.3f", worker.pid, time.time())
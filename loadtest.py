@@ -0,0 +1,644 @@
+"""
+File:           loadtest.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:06 am
+
+Load test for the dash app. Starts gunicorn with the stand-in database for each worker and thread
+count and replays user sessions through the dash _dash-update-component protocol.
+
+Filter toggles are replayed both ways with --toggle-mode both (default). "clientside" is the
+current app where toggles never reach the server. "server" starts the app with
+AUTOCLOUD_SERVER_SIDE_TOGGLES=1, i.e. the server callbacks used before, and sends each toggle as a
+_dash-update-component request.
+
+Open browser tabs are simulated by --streams concurrent connections to the /deal-updates event
+stream, held for the whole run, so that the callback latency is measured while the streams hold
+worker threads.
+
+Usage:
+    python loadtest.py --workers 1 2 4 --threads 1 4 --users 20 --sessions 3 --streams 50
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+
+from filters import FILTER_FIELDS
+from standin_db import STANDIN_MAKE_MODELS
+
+
+FILTER_STATE_IDS = [
+    ("year_actual_filter_options", "value"),
+    ("make_actual_filter_options", "value"),
+    ("model_actual_filter_options", "value"),
+    ("odometer_actual_filter_min", "value"),
+    ("odometer_actual_filter_max", "value"),
+    ("price_actual_filter_min", "value"),
+    ("price_actual_filter_max", "value"),
+    ("offer_price_actual_filter_min", "value"),
+    ("offer_price_actual_filter_max", "value"),
+]
+
+FILTER_TOGGLE_BUTTONS = ("year", "make", "model", "odometer", "price", "offer_price")
+TOGGLE_MODES = ("clientside", "server")
+
+
+def get_free_port():
+    """ Return a free local port """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def callback_payload(outputs, inputs, state=(), changed=()):
+    """
+    Build the body of _dash-update-component request. outputs, inputs and state are list of
+    (id, property) or (id, property, value)
+    """
+    output_ids = [f"{component_id}.{prop}" for component_id, prop in outputs]
+    if len(outputs) == 1:
+        output = output_ids[0]
+        outputs_list = {"id": outputs[0][0], "property": outputs[0][1]}
+    else:
+        output = ".." + "...".join(output_ids) + ".."
+        outputs_list = [{"id": component_id, "property": prop} for component_id, prop in outputs]
+    return {
+        "output": output,
+        "outputs": outputs_list,
+        "inputs": [{"id": x[0], "property": x[1], "value": x[2]} for x in inputs],
+        "state": [{"id": x[0], "property": x[1], "value": x[2]} for x in state],
+        "changedPropIds": [f"{component_id}.{prop}" for component_id, prop in changed],
+    }
+
+
+def get_layout_values(layout):
+    """ {(component id, property): value} of all the components with an id in the layout json """
+    values = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict):
+            props = node.get("props", {})
+            if "id" in props:
+                values.update(((props["id"], prop), value) for prop, value in props.items())
+            stack.extend(value for value in props.values() if isinstance(value, (dict, list)))
+    return values
+
+
+def get_initial_callbacks(dependencies):
+    """
+    List of (outputs, inputs, state) of the server callbacks a browser calls on page load, from
+    the _dash-dependencies json. Clientside callbacks never reach the server, so they are skipped.
+    """
+    callbacks = []
+    for dependency in dependencies:
+        if dependency.get("clientside_function") or dependency.get("prevent_initial_call"):
+            continue
+        output = dependency["output"]
+        # Multiple outputs are sent as "..id1.prop1...id2.prop2.."
+        output_ids = output[2:-2].split("...") if output.startswith("..") else [output]
+        callbacks.append((
+            [tuple(output_id.rsplit(".", 1)) for output_id in output_ids],
+            [(x["id"], x["property"]) for x in dependency["inputs"]],
+            [(x["id"], x["property"]) for x in dependency["state"]],
+        ))
+    return callbacks
+
+
+class Stats:
+    """ Thread safe request latency collector """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = 0
+        self.sessions = 0
+        self.toggles = 0
+        self.stream_connections = 0
+        self.open_streams = 0
+        self.max_open_streams = 0
+        self.stream_events = 0
+        self.stream_errors = 0
+        # Last snapshot version pushed by the server on the deal update streams
+        self.stream_version = None
+
+    def record(self, name, latency):
+        with self._lock:
+            self.latencies[name].append(latency)
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def record_session(self, toggles):
+        with self._lock:
+            self.sessions += 1
+            self.toggles += toggles
+
+    def record_stream_open(self):
+        with self._lock:
+            self.stream_connections += 1
+            self.open_streams += 1
+            self.max_open_streams = max(self.max_open_streams, self.open_streams)
+
+    def record_stream_close(self):
+        with self._lock:
+            self.open_streams -= 1
+
+    def record_stream_event(self, version):
+        with self._lock:
+            self.stream_events += 1
+            self.stream_version = version
+
+    def record_stream_error(self):
+        with self._lock:
+            self.stream_errors += 1
+
+    @property
+    def all_latencies(self):
+        return sorted(x for values in self.latencies.values() for x in values)
+
+    @staticmethod
+    def percentile(sorted_values, percent):
+        """ Nearest rank percentile """
+        if not sorted_values:
+            return 0.0
+        index = max(0, int(round(percent / 100 * len(sorted_values))) - 1)
+        return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class UserSession:
+    """ Replay a realistic user session against the app """
+
+    def __init__(self, base_url, stats, seed=None, server_side_toggles=False):
+        self._base_url = base_url
+        self._stats = stats
+        self._rand = random.Random(seed)
+        self._server_side_toggles = server_side_toggles
+        self._toggle_n_clicks = dict.fromkeys(FILTER_TOGGLE_BUTTONS, 0)
+        self._toggle_is_open = dict.fromkeys(FILTER_TOGGLE_BUTTONS, False)
+        self._table_data = []
+        self._version = None
+        self._filter_values = [[], [], [], "", "", "", "", "", ""]
+        self._applied_filter = None
+        self._apply_n_clicks = 0
+        self._save_n_clicks = 0
+
+    def _request(self, name, path, payload=None):
+        url = f"{self._base_url}{path}"
+        data = None
+        headers = {}
+        if payload is not None:
+            data = json.dumps(payload).encode()
+            headers["Content-Type"] = "application/json"
+        request = urllib.request.Request(url, data=data, headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                body = response.read()
+                status = response.status
+        except urllib.error.HTTPError as err:
+            body = err.read()
+            status = err.code
+        except (urllib.error.URLError, socket.timeout):
+            self._stats.record_error()
+            return None
+        self._stats.record(name, time.perf_counter() - start)
+        # 204 is returned when the callback raises PreventUpdate
+        if status not in (200, 204):
+            self._stats.record_error()
+            return None
+        if status == 204 or not body or payload is None:
+            return body
+        return json.loads(body)
+
+    def _callback(self, name, outputs, inputs, state=(), changed=()):
+        payload = callback_payload(outputs, inputs, state=state, changed=changed)
+        return self._request(name, "/_dash-update-component", payload)
+
+    def _filter_state(self):
+        return [(*ids, value) for ids, value in zip(FILTER_STATE_IDS, self._filter_values)]
+
+    def page_load(self):
+        """
+        Index page, layout, dependencies and the initial callbacks. Like the browser, every server
+        callback of _dash-dependencies without prevent_initial_call is called once with the values
+        of the layout.
+        """
+        self._request("index", "/")
+        layout = self._request("layout", "/_dash-layout")
+        dependencies = self._request("dependencies", "/_dash-dependencies")
+        if layout is None or dependencies is None:
+            return
+        values = get_layout_values(json.loads(layout))
+        for outputs, inputs, state in get_initial_callbacks(json.loads(dependencies)):
+            if ("deal_filtered_store", "data") in outputs:
+                # Table data and applied filter of the session come from the filter callback
+                self.apply_filter(initial=True)
+                continue
+            self._callback(
+                f"initial_{outputs[0][0]}", outputs,
+                [(*ids, values.get(ids)) for ids in inputs],
+                state=[(*ids, values.get(ids)) for ids in state]
+            )
+
+    def _toggle_callback(self, filter_name, changed):
+        """ Server side show/hide of the filter options """
+        self._callback(
+            "toggle",
+            [(f"{filter_name}_filter_options", "is_open")],
+            [(f"{filter_name}_filter_btn", "n_clicks", self._toggle_n_clicks[filter_name])],
+            state=[(f"{filter_name}_filter_options", "is_open",
+                    self._toggle_is_open[filter_name])],
+            changed=changed
+        )
+
+    def toggle_filters(self):
+        """
+        Click some of the filter buttons. Clientside toggles send no request. Server side toggles
+        send one request per click. Return the no of clicks.
+        """
+        filter_names = self._rand.sample(
+            FILTER_TOGGLE_BUTTONS, self._rand.randint(1, len(FILTER_TOGGLE_BUTTONS))
+        )
+        for filter_name in filter_names:
+            self._toggle_n_clicks[filter_name] += 1
+            if self._server_side_toggles:
+                self._toggle_callback(filter_name, changed=[(f"{filter_name}_filter_btn",
+                                                             "n_clicks")])
+            self._toggle_is_open[filter_name] = not self._toggle_is_open[filter_name]
+        return len(filter_names)
+
+    def random_filter_values(self):
+        """ Random filter criteria """
+        makes = sorted(make.lower() for make in STANDIN_MAKE_MODELS)
+        values = dict.fromkeys(FILTER_FIELDS, "")
+        values.update(year=[], make=[], model=[])
+        if self._rand.random() < 0.5:
+            values["year"] = [str(year) for year in self._rand.sample(range(2005, 2022), 3)]
+        if self._rand.random() < 0.6:
+            values["make"] = self._rand.sample(makes, self._rand.randint(1, 3))
+        if self._rand.random() < 0.4:
+            values["max_odometer"] = self._rand.randint(20000, 200000)
+        if self._rand.random() < 0.4:
+            values["min_price"] = self._rand.randint(2000, 30000)
+        if self._rand.random() < 0.3:
+            values["max_offer_price"] = self._rand.randint(90, 140)
+        return [values[field] for field in FILTER_FIELDS]
+
+    def apply_filter(self, initial=False):
+        """ Apply button """
+        if not initial:
+            self._apply_n_clicks += 1
+        response = self._callback(
+            "filter",
+            [("deal_filtered_store", "data"), ("applied_filter", "data"),
+             ("bulk_update_confirm", "message"), ("error_alert", "children"),
+             ("error_alert", "is_open"), ("error_alert", "duration")],
+            [("filter_apply_btn", "n_clicks", self._apply_n_clicks),
+             ("bulk_update_done", "data", 0)],
+            state=[*self._filter_state(), ("applied_filter", "data", self._applied_filter)],
+            changed=[] if initial else [("filter_apply_btn", "n_clicks")]
+        )
+        # Filtered data is missing if the filter is invalid
+        filtered = response["response"].get("deal_filtered_store") if response else None
+        if filtered:
+            self._table_data = filtered["data"]["rows"] or []
+            self._version = filtered["data"]["version"]
+            self._applied_filter = response["response"]["applied_filter"]["data"]
+
+    def select_saved_filter(self):
+        """ Select a saved filter. It changes the filter values and applies the filter """
+        filter_name = self._rand.choice(["Cheap Toyota", "Recent low miles"])
+        response = self._callback(
+            "saved_filter",
+            [("year_actual_filter_options", "value"), ("make_actual_filter_options", "value"),
+             ("model_actual_filter_options", "value"), ("odometer_actual_filter_min", "value"),
+             ("odometer_actual_filter_max", "value"), ("price_actual_filter_min", "value"),
+             ("price_actual_filter_max", "value"), ("offer_price_actual_filter_min", "value"),
+             ("offer_price_actual_filter_max", "value"), ("filter_apply_btn", "n_clicks")],
+            [("filter_clear_btn", "n_clicks", 0),
+             ("filter_radioitems_input", "value", filter_name)],
+            state=[("filter_apply_btn", "n_clicks", self._apply_n_clicks)],
+            changed=[("filter_radioitems_input", "value")]
+        )
+        if response:
+            outputs = response["response"]
+            self._filter_values = [outputs[component_id][prop]
+                                   for component_id, prop in FILTER_STATE_IDS]
+            self._apply_n_clicks = outputs["filter_apply_btn"]["n_clicks"] - 1
+            self.apply_filter()
+
+    def save(self):
+        """ Save button in the navbar with the first page of the table """
+        self._save_n_clicks += 1
+        viewport = self._table_data[:20]
+        for record in viewport:
+            record["Action"] = self._rand.choice(["Action1", "Action2", "Action3"])
+        self._callback(
+            "save",
+            [("status_alert", "children"), ("status_alert", "is_open"),
+             ("status_alert", "duration")],
+            [("navbar_save_btn", "n_clicks", self._save_n_clicks)],
+            state=[("potential_deal_table", "derived_viewport_data", viewport)],
+            changed=[("navbar_save_btn", "n_clicks")]
+        )
+
+    def deal_update(self):
+        """
+        Deal update pushed by the server. Browser fetches the changed rows. Only sent when the
+        deal update streams received a version which is not in the table yet.
+        """
+        version = self._stats.stream_version
+        if version is None or version == self._version:
+            return
+        event = {"version": version, "previous_version": self._version}
+        self._callback(
+            "deal_update",
+            [("deal_delta_store", "data")],
+            [("deal_update_event", "data", event)],
+            state=[("deal_snapshot_version", "data", self._version),
+                   ("applied_filter", "data", self._applied_filter)],
+            changed=[("deal_update_event", "data")]
+        )
+
+    def run(self, think_time=0.0):
+        """ Run one full session """
+        toggles = 0
+        self.page_load()
+        for _ in range(self._rand.randint(1, 3)):
+            toggles += self.toggle_filters()
+            self._filter_values = self.random_filter_values()
+            self.apply_filter()
+            time.sleep(think_time)
+        self.select_saved_filter()
+        time.sleep(think_time)
+        self.save()
+        self.deal_update()
+        self._stats.record_session(toggles)
+
+
+class DealUpdateListener:
+    """ Browser tab listening to the deal update stream like EventSource, reconnects included """
+    # Socket timeout. Server sends a keep-alive comment every 15 sec
+    READ_TIMEOUT = 60
+
+    def __init__(self, base_url, stats, done):
+        self._url = f"{base_url}/deal-updates"
+        self._stats = stats
+        self._done = done
+        self._last_event_id = None
+        self._retry = 5.0
+
+    def _listen(self):
+        """ Read one stream until the server closes it """
+        headers = {"Accept": "text/event-stream"}
+        if self._last_event_id:
+            headers["Last-Event-ID"] = self._last_event_id
+        request = urllib.request.Request(self._url, headers=headers)
+        with urllib.request.urlopen(request, timeout=DealUpdateListener.READ_TIMEOUT) as response:
+            self._stats.record_stream_open()
+            try:
+                for raw_line in response:
+                    if self._done.is_set():
+                        break
+                    line = raw_line.decode().rstrip("\r\n")
+                    if line.startswith("retry:"):
+                        self._retry = int(line[len("retry:"):]) / 1000
+                    elif line.startswith("id:"):
+                        self._last_event_id = line[len("id:"):].strip()
+                    elif line.startswith("event:"):
+                        # id line of the event comes before the event line
+                        self._stats.record_stream_event(self._last_event_id)
+            finally:
+                self._stats.record_stream_close()
+
+    def run(self):
+        while not self._done.is_set():
+            try:
+                self._listen()
+            except (urllib.error.URLError, socket.timeout, ConnectionError):
+                self._stats.record_stream_error()
+            self._done.wait(self._retry)
+
+
+class GunicornServer:
+    """ Run gunicorn with the stand-in database app """
+
+    def __init__(self, workers, threads, deals, extra_args=(), env=None):
+        self._workers = workers
+        self._threads = threads
+        self._deals = deals
+        self._extra_args = list(extra_args)
+        self._env = env or {}
+        self.port = get_free_port()
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=300):
+        env = dict(
+            os.environ, AUTOCLOUD_STANDIN_DEALS=str(self._deals),
+            AUTOCLOUD_STANDIN_EPOCH=str(time.time()), **self._env
+        )
+        cmd = [
+            sys.executable, "-m", "gunicorn.app.wsgiapp",
+            "--config", "gunicorn.conf.py",
+            "--workers", str(self._workers),
+            "--threads", str(self._threads),
+            "--bind", f"127.0.0.1:{self.port}",
+            "--timeout", "300",
+            "--log-level", "warning",
+            *self._extra_args,
+            "standin_db:create_standin_app()",
+        ]
+        self.process = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+        start = time.time()
+        while time.time() - start < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError("gunicorn exited before it was ready")
+            try:
+                with urllib.request.urlopen(f"{self.base_url}/_dash-layout", timeout=5):
+                    return
+            except (urllib.error.URLError, socket.timeout, ConnectionError):
+                time.sleep(0.5)
+        raise RuntimeError("gunicorn didn't start in time")
+
+    def stop(self):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait(timeout=60)
+
+    def worker_pids(self):
+        """ Worker pids are the child processes of the gunicorn master """
+        pids = []
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as stat_file:
+                    stat = stat_file.read()
+            except OSError:
+                continue
+            # Process name can contain spaces. ppid is the 2nd field after the name
+            ppid = int(stat.rsplit(")", 1)[1].split()[1])
+            if ppid == self.process.pid:
+                pids.append(int(entry))
+        return pids
+
+
+def get_rss_mb(pid):
+    """ Resident set size of the process in MB. Linux only """
+    try:
+        with open(f"/proc/{pid}/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def run_load(server, users, sessions, think_time, server_side_toggles=False, streams=0):
+    """
+    Run concurrent user sessions with the deal update streams open and return the stats with
+    memory samples
+    """
+    stats = Stats()
+    max_rss = defaultdict(float)
+    done = threading.Event()
+    listeners = [
+        threading.Thread(target=DealUpdateListener(server.base_url, stats, done).run, daemon=True)
+        for _ in range(streams)
+    ]
+    for listener in listeners:
+        listener.start()
+
+    def sample_memory():
+        while not done.is_set():
+            for pid in server.worker_pids():
+                max_rss[pid] = max(max_rss[pid], get_rss_mb(pid))
+            done.wait(0.5)
+
+    def user(user_no):
+        for session_no in range(sessions):
+            UserSession(
+                server.base_url, stats, seed=user_no * 1000 + session_no,
+                server_side_toggles=server_side_toggles
+            ).run(think_time)
+
+    sampler = threading.Thread(target=sample_memory, daemon=True)
+    sampler.start()
+    threads = [threading.Thread(target=user, args=(user_no,)) for user_no in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - start
+    done.set()
+    sampler.join()
+    # Listeners are blocked on the stream until the next keep-alive. They are daemon threads, so
+    # the ones still blocked are left to the server shutdown.
+    for listener in listeners:
+        listener.join(timeout=1)
+    return stats, duration, dict(max_rss)
+
+
+def get_requests_per_session(stats):
+    """ Average no of server requests of a session """
+    if not stats.sessions:
+        return 0.0
+    return len(stats.all_latencies) / stats.sessions
+
+
+def print_report(workers, threads, toggle_mode, stats, duration, max_rss):
+    """ Print the summary for one configuration """
+    latencies = stats.all_latencies
+    no_of_requests = len(latencies)
+    print(f"\nworkers={workers} threads={threads} toggles={toggle_mode}")
+    print(f"  sessions: {stats.sessions}, requests: {no_of_requests}, errors: {stats.errors}")
+    if stats.sessions:
+        print(f"  server requests per session: {get_requests_per_session(stats):.1f} "
+              f"(filter toggle clicks per session: {stats.toggles / stats.sessions:.1f})")
+    print(f"  throughput: {no_of_requests / duration:.1f} req/s over {duration:.1f}s")
+    if stats.stream_connections or stats.stream_errors:
+        print(f"  deal update streams: connections {stats.stream_connections}, max open "
+              f"{stats.max_open_streams}, events {stats.stream_events}, "
+              f"errors {stats.stream_errors}")
+    print("  latency ms: p50={:.1f} p95={:.1f} p99={:.1f}".format(
+        *(Stats.percentile(latencies, x) * 1000 for x in (50, 95, 99))
+    ))
+    for name in sorted(stats.latencies):
+        values = sorted(stats.latencies[name])
+        print("    {:<36} n={:<6} p50={:>8.1f} p95={:>8.1f} p99={:>8.1f}".format(
+            name, len(values), *(Stats.percentile(values, x) * 1000 for x in (50, 95, 99))
+        ))
+    for pid, rss in sorted(max_rss.items()):
+        print(f"  worker {pid}: max rss {rss:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the dash app with gunicorn")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--users", type=int, default=20, help="Concurrent users")
+    parser.add_argument("--sessions", type=int, default=3, help="Sessions per user")
+    parser.add_argument("--deals", type=int, default=20000, help="No of synthetic deals")
+    parser.add_argument("--think-time", type=float, default=0.0,
+                        help="Seconds between user actions")
+    parser.add_argument("--gunicorn-arg", action="append", default=[],
+                        help="Extra argument passed to gunicorn. Can be repeated")
+    parser.add_argument("--streams", type=int, default=20,
+                        help="Concurrent deal update streams, i.e. open browser tabs")
+    parser.add_argument("--poll-interval", type=int, default=5,
+                        help="Seconds between the deal reloads of each worker")
+    parser.add_argument("--toggle-mode", choices=[*TOGGLE_MODES, "both"], default="both",
+                        help="Replay the filter toggles clientside, as server callbacks or both")
+    args = parser.parse_args()
+
+    toggle_modes = TOGGLE_MODES if args.toggle_mode == "both" else (args.toggle_mode,)
+    for workers in args.workers:
+        for threads in args.threads:
+            requests_per_session = {}
+            for toggle_mode in toggle_modes:
+                server_side_toggles = toggle_mode == "server"
+                server = GunicornServer(
+                    workers, threads, args.deals, args.gunicorn_arg,
+                    env={
+                        "AUTOCLOUD_SERVER_SIDE_TOGGLES": "1" if server_side_toggles else "0",
+                        "AUTOCLOUD_DEAL_POLL_INTERVAL": str(args.poll_interval),
+                    }
+                )
+                server.start()
+                try:
+                    stats, duration, max_rss = run_load(
+                        server, args.users, args.sessions, args.think_time,
+                        server_side_toggles=server_side_toggles, streams=args.streams
+                    )
+                finally:
+                    server.stop()
+                print_report(workers, threads, toggle_mode, stats, duration, max_rss)
+                requests_per_session[toggle_mode] = get_requests_per_session(stats)
+            if len(requests_per_session) == len(TOGGLE_MODES) and requests_per_session["server"]:
+                # Sessions use the same seeds in both modes, so they click the same toggles
+                reduction = 1 - requests_per_session["clientside"] / requests_per_session["server"]
+                print(f"  requests per session: server toggles "
+                      f"{requests_per_session['server']:.1f}, clientside toggles "
+                      f"{requests_per_session['clientside']:.1f} ({reduction:.0%} fewer)")
+
+
+if __name__ == "__main__":
+    main()
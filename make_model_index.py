@@ -0,0 +1,109 @@
+"""
+File:           make_model_index.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:05 am
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+
+class SortedPrefixIndex:
+    """ Sorted list of (key, label) for prefix lookup using binary search """
+
+    def __init__(self, labels):
+        # Lower case key is the checklist option value
+        items = sorted({label.lower(): label for label in labels}.items())
+        self._keys = [key for key, _ in items]
+        self._labels = [label for _, label in items]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def search(self, prefix="", limit=None):
+        """ Return list of (key, label) whose key starts with prefix """
+        prefix = (prefix or "").strip().lower()
+        results = []
+        index = bisect_left(self._keys, prefix)
+        while index < len(self._keys) and self._keys[index].startswith(prefix):
+            if limit is not None and len(results) >= limit:
+                break
+            results.append((self._keys[index], self._labels[index]))
+            index += 1
+        return results
+
+    def get_label(self, key):
+        """ Return the label for the key. Returns the key if it is not in the index """
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return self._labels[index]
+        return key
+
+
+class MakeModelIndex:
+    """ Prefix index on make and models from vauto_make_model for type ahead search """
+    # Max no of options sent to the browser for a single lookup
+    MAX_OPTIONS = 100
+
+    def __init__(self, make_model):
+        self._makes = SortedPrefixIndex(make_model.keys())
+        # Used to split make_model_year. Makes like "Land Rover" have more than one word.
+        self._make_labels = {make.lower(): make for make in make_model}
+        self._max_make_words = max((len(make.split()) for make in make_model), default=1)
+        self._all_models = SortedPrefixIndex(
+            model for models in make_model.values() for model in models
+        )
+        models_by_make = defaultdict(list)
+        for make, models in make_model.items():
+            models_by_make[make.lower()].extend(models)
+        self._models_by_make = {
+            make: SortedPrefixIndex(models) for make, models in models_by_make.items()
+        }
+
+    def split_make_model(self, make_model):
+        """
+        Return (make, model) of a text like "Land Rover Range Rover". Make is the longest make of
+        the catalog the text starts with. For makes not in the catalog it is the first word.
+        """
+        words = (make_model or "").split()
+        for no_of_words in range(min(self._max_make_words, len(words)), 0, -1):
+            make = self._make_labels.get(" ".join(words[:no_of_words]).lower())
+            if make is not None:
+                return make, " ".join(words[no_of_words:])
+        if not words:
+            return "", ""
+        return words[0].title(), " ".join(words[1:])
+
+    def search_makes(self, prefix=""):
+        """ Return list of (value, label) of makes starting with prefix """
+        return self._makes.search(prefix, limit=MakeModelIndex.MAX_OPTIONS)
+
+    def search_models(self, prefix="", makes=None):
+        """
+        Return list of (value, label) of models starting with prefix. If makes is given, only the
+        models of those makes are returned.
+        """
+        if not makes:
+            # Without a make, all the models are only listed when user types something
+            if not (prefix or "").strip():
+                return []
+            return self._all_models.search(prefix, limit=MakeModelIndex.MAX_OPTIONS)
+        results = {}
+        for make in makes:
+            make_index = self._models_by_make.get(make)
+            if make_index is None:
+                continue
+            for key, label in make_index.search(prefix, limit=MakeModelIndex.MAX_OPTIONS):
+                results.setdefault(key, label)
+        return sorted(results.items())[:MakeModelIndex.MAX_OPTIONS]
+
+    def get_options(self, results, selected=None, is_make=False):
+        """
+        Return the checklist options from the search results. Already selected values are always
+        part of the options so that they are not unselected.
+        """
+        index = self._makes if is_make else self._all_models
+        options = {key: label for key, label in results}
+        for key in selected or []:
+            if key:
+                options.setdefault(key, index.get_label(key))
+        return [{"label": label, "value": key} for key, label in sorted(options.items())]
@@ -0,0 +1,130 @@
+"""
+File:           query_log.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:13 am
+"""
+import os
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import text
+
+
+class QueryLog:
+    """
+    Duration, row count and size of the queries issued by DBApi. Recent and slow queries are kept
+    in bounded ring buffers. EXPLAIN output of slow SELECT queries can be captured.
+    """
+    # Queries taking longer than this are logged as slow
+    SLOW_QUERY_MS = float(os.environ.get("AUTOCLOUD_SLOW_QUERY_MS", 500))
+    # Run EXPLAIN for the slow SELECT queries
+    EXPLAIN_SLOW_QUERIES = os.environ.get("AUTOCLOUD_EXPLAIN_SLOW_QUERIES", "0") == "1"
+    MAX_RECENT_QUERIES = 200
+    MAX_SLOW_QUERIES = 100
+    # Statements are truncated to this length in the log
+    MAX_STATEMENT_LENGTH = 2000
+    # Size of the fetched rows is estimated from these many rows
+    SIZE_SAMPLE_ROWS = 100
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent_queries = deque(maxlen=QueryLog.MAX_RECENT_QUERIES)
+        self._slow_queries = deque(maxlen=QueryLog.MAX_SLOW_QUERIES)
+        self._no_of_queries = 0
+        self._no_of_slow_queries = 0
+
+    @staticmethod
+    def get_size(rows):
+        """
+        Approximate size in bytes of the fetched rows. Estimated from evenly spaced sample rows,
+        so a full table load doesn't stringify every cell.
+        """
+        if not rows:
+            return 0
+        step = max(1, len(rows) // QueryLog.SIZE_SAMPLE_ROWS)
+        sample = rows[::step]
+        size = 0
+        for row in sample:
+            for value in row:
+                if value is None:
+                    continue
+                if isinstance(value, (bytes, bytearray)):
+                    size += len(value)
+                else:
+                    size += len(str(value))
+        return size * len(rows) // len(sample)
+
+    @staticmethod
+    def explain(conn, statement, params):
+        """ EXPLAIN output of a SELECT statement """
+        if not statement.lstrip().upper().startswith("SELECT") or params:
+            # Statements with bound params (like expanding IN) are not explained
+            return None
+        try:
+            rows = conn.execute(text(f"EXPLAIN {statement}")).fetchall()
+        except Exception as err:
+            return [{"error": str(err)}]
+        # Values like Decimal are converted to str for json
+        return [
+            {
+                key: value if isinstance(value, (int, float, str, type(None))) else str(value)
+                for key, value in dict(row).items()
+            }
+            for row in rows
+        ]
+
+    def execute(self, conn, query, fetch=False, **params):
+        """
+        Execute the query on the connection and record it. Return the fetched rows if fetch is
+        True else the result proxy.
+        """
+        start = time.perf_counter()
+        result = conn.execute(query, **params)
+        if fetch:
+            rows = result.fetchall()
+            duration_ms = (time.perf_counter() - start) * 1000
+            self.record(conn, str(query), params, duration_ms, len(rows), self.get_size(rows))
+            return rows
+        duration_ms = (time.perf_counter() - start) * 1000
+        self.record(conn, str(query), params, duration_ms, result.rowcount, 0)
+        return result
+
+    def record(self, conn, statement, params, duration_ms, no_of_rows, size):
+        """ Add the query to the log. Slow queries are printed and optionally explained """
+        statement = " ".join(statement.split())
+        entry = {
+            "time": time.time(),
+            "statement": statement[:QueryLog.MAX_STATEMENT_LENGTH],
+            "duration_ms": round(duration_ms, 3),
+            "rows": no_of_rows,
+            "bytes": size,
+            "slow": duration_ms >= QueryLog.SLOW_QUERY_MS,
+        }
+        if entry["slow"]:
+            print(f"Slow query ({duration_ms:.1f} ms, {no_of_rows} rows, {size} bytes): "
+                  f"{entry['statement'][:200]}")
+            if QueryLog.EXPLAIN_SLOW_QUERIES:
+                entry["explain"] = self.explain(conn, statement, params)
+        with self._lock:
+            self._no_of_queries += 1
+            self._recent_queries.append(entry)
+            if entry["slow"]:
+                self._no_of_slow_queries += 1
+                self._slow_queries.append(entry)
+
+    def stats(self):
+        """ Counters and the ring buffers """
+        with self._lock:
+            return {
+                "slow_query_ms": QueryLog.SLOW_QUERY_MS,
+                "explain_slow_queries": QueryLog.EXPLAIN_SLOW_QUERIES,
+                "no_of_queries": self._no_of_queries,
+                "no_of_slow_queries": self._no_of_slow_queries,
+                "slow_queries": list(self._slow_queries),
+                "recent_queries": list(self._recent_queries),
+            }
+
+
+# Shared by the whole process
+query_log = QueryLog()
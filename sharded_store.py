@@ -0,0 +1,291 @@
+"""
+File:           sharded_store.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:10 am
+
+Optional sharded execution of filter, facet and sort on the potential deals. Columns of the
+snapshot are written to memory mapped files which are shared by a pool of processes. Each process
+works on a contiguous range of rows, i.e. a PotentialDealID range as the rows are ordered by
+PotentialDealID DESC, and the partial results are merged in the parent.
+
+The same columns are used in-process by DealColumns when the sharded execution is disabled.
+"""
+import atexit
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from filters import get_filter_needles
+
+# Numeric columns of vw_Deal used by the filters and the name of their file
+NUMERIC_COLUMNS = {
+    "PotentialDealID": "id",
+    "odometer": "odometer",
+    "price": "price",
+    "OfferPricePctMMR": "offer_price",
+}
+YEAR_REGEX = re.compile(r"^\s*(\d+)")
+
+# Memory mapped columns opened by a pool process. {directory: {column: array}}
+_open_columns = {}
+
+
+def _get_columns(directory):
+    """ Open the memory mapped columns of the directory once per process """
+    columns = _open_columns.get(directory)
+    if columns is None:
+        # Only the latest snapshot is kept open
+        _open_columns.clear()
+        columns = {
+            name[:-4]: np.load(os.path.join(directory, name), mmap_mode="r")
+            for name in os.listdir(directory)
+            if name.endswith(".npy")
+        }
+        _open_columns[directory] = columns
+    return columns
+
+
+def _get_shard_mask(columns, start, stop, criteria):
+    """ Boolean mask of the rows in [start, stop) matching the filter criteria """
+    mask = np.ones(stop - start, dtype=bool)
+    make_model_year = columns["make_model_year"][start:stop]
+    # Same matching as filters.is_matching_record
+    for field in ("year", "make", "model"):
+        needles = get_filter_needles(criteria, field)
+        if not needles:
+            continue
+        field_mask = np.zeros(stop - start, dtype=bool)
+        for needle in needles:
+            field_mask |= np.char.find(make_model_year, needle.encode()) >= 0
+        mask &= field_mask
+    bounds = (
+        ("odometer", "min_odometer", "max_odometer"),
+        ("price", "min_price", "max_price"),
+        ("offer_price", "min_offer_price", "max_offer_price"),
+    )
+    for column, min_field, max_field in bounds:
+        values = columns[column][start:stop]
+        if criteria.get(min_field):
+            mask &= values >= int(criteria[min_field])
+        if criteria.get(max_field):
+            mask &= values <= int(criteria[max_field])
+    return mask
+
+
+def filter_shard(directory, start, stop, criteria):
+    """ Positions of the rows in [start, stop) matching the filter criteria """
+    columns = _get_columns(directory)
+    return np.flatnonzero(_get_shard_mask(columns, start, stop, criteria)) + start
+
+
+def count_years_shard(directory, start, stop, criteria):
+    """ No of matching rows of each year in [start, stop) """
+    columns = _get_columns(directory)
+    years = columns["year"][start:stop][_get_shard_mask(columns, start, stop, criteria)]
+    values, counts = np.unique(years[years > 0], return_counts=True)
+    return dict(zip(values.tolist(), counts.tolist()))
+
+
+def sort_shard(directory, start, stop, criteria, column, descending):
+    """ (sorted values, positions) of the matching rows in [start, stop) """
+    columns = _get_columns(directory)
+    positions = np.flatnonzero(_get_shard_mask(columns, start, stop, criteria)) + start
+    values = np.asarray(columns[column][positions])
+    if descending:
+        values = -values
+    # Stable sort keeps the PotentialDealID DESC order of the rows with the same value
+    order = np.argsort(values, kind="stable")
+    return values[order], positions[order]
+
+
+class ShardedDealStore:
+    """ Potential deal columns shared by a pool of processes, one shard per process """
+    # No of shards. 0 disables the sharded execution.
+    NO_OF_SHARDS = int(os.environ.get("AUTOCLOUD_FILTER_SHARDS", 0))
+
+    def __init__(self, no_of_shards):
+        self._no_of_shards = no_of_shards
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self._directory = None
+        self._stale_directory = None
+        # Process which created the directories. Only that process removes them.
+        self._owner_pid = None
+        self._version = None
+        self._no_of_rows = 0
+        # Otherwise the directories are left in the temp dir when a gunicorn worker exits or
+        # restarts
+        atexit.register(self.close)
+
+    @staticmethod
+    def is_enabled():
+        return ShardedDealStore.NO_OF_SHARDS > 0
+
+    @property
+    def version(self):
+        return self._version
+
+    @property
+    def directory(self):
+        return self._directory
+
+    @property
+    def shards(self):
+        """ (start, stop) of each shard """
+        shard_size = -(-self._no_of_rows // self._no_of_shards) or 1
+        return [
+            (start, min(start + shard_size, self._no_of_rows))
+            for start in range(0, self._no_of_rows, shard_size)
+        ]
+
+    def _get_pool(self):
+        """ Process pool is created lazily in each worker process. Pools don't survive fork """
+        if self._pool is None or self._pid != os.getpid():
+            # spawn as forking a process with running threads is not safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._no_of_shards,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            self._pid = os.getpid()
+        return self._pool
+
+    @staticmethod
+    def get_columns(potential_records):
+        """ Columns of the potential records as numpy arrays """
+        columns = {
+            file_name: np.array(
+                [np.nan if data[column] is None else float(data[column])
+                 for data in potential_records],
+                dtype=np.float64
+            )
+            for column, file_name in NUMERIC_COLUMNS.items()
+        }
+        # int() is used on the values by the non sharded filter
+        for file_name in ("odometer", "price", "offer_price"):
+            columns[file_name] = np.trunc(columns[file_name])
+        make_model_year = [data["make_model_year"] or "" for data in potential_records]
+        columns["make_model_year"] = np.array(
+            [value.lower().encode() for value in make_model_year], dtype=np.bytes_
+        )
+        years = []
+        for value in make_model_year:
+            match_obj = YEAR_REGEX.search(value)
+            years.append(int(match_obj.group(1)) if match_obj is not None else 0)
+        columns["year"] = np.array(years, dtype=np.int32)
+        return columns
+
+    def load_columns(self, columns, version):
+        """ Write the columns to memory mapped files for the version """
+        with self._lock:
+            directory = tempfile.mkdtemp(prefix=f"autocloud_shards_{version}_")
+            for name, values in columns.items():
+                np.save(os.path.join(directory, f"{name}.npy"), values)
+            if self._owner_pid != os.getpid():
+                # Directories inherited through fork belong to the parent
+                self._directory = None
+                self._stale_directory = None
+                self._owner_pid = os.getpid()
+            # Requests already fanned out may still use the previous directory. So it is removed
+            # only on the next load.
+            stale_directory = self._stale_directory
+            self._stale_directory = self._directory
+            self._directory = directory
+            self._version = version
+            self._no_of_rows = len(columns["id"])
+        if stale_directory is not None:
+            shutil.rmtree(stale_directory, ignore_errors=True)
+
+    def load(self, potential_records, version):
+        """ Load the snapshot if it is not loaded already """
+        if version != self._version:
+            self.load_columns(self.get_columns(potential_records), version)
+
+    def _fan_out(self, func, *args):
+        """
+        Run func on each shard. Return (version, partial results in shard order). Version is the
+        snapshot version the results belong to.
+        """
+        with self._lock:
+            version = self._version
+            directory = self._directory
+            shards = self.shards
+        pool = self._get_pool()
+        futures = [pool.submit(func, directory, start, stop, *args) for start, stop in shards]
+        return version, [future.result() for future in futures]
+
+    def filter(self, criteria):
+        """ (version, positions of the matching rows in PotentialDealID DESC order) """
+        version, partial_results = self._fan_out(filter_shard, criteria)
+        if not partial_results:
+            return version, np.empty(0, dtype=np.int64)
+        # Shards are contiguous ranges in the same order as the rows, so concatenation is enough
+        return version, np.concatenate(partial_results)
+
+    def count_years(self, criteria):
+        """ (version, list of (year, no of vehicles) sorted by year DESC) """
+        version, partial_results = self._fan_out(count_years_shard, criteria)
+        years = Counter()
+        for partial_result in partial_results:
+            years.update(partial_result)
+        return version, sorted(((str(year), count) for year, count in years.items()), reverse=True)
+
+    def sort(self, criteria, column, descending=False):
+        """ (version, positions of the matching rows sorted by the column) """
+        version, partial_results = self._fan_out(sort_shard, criteria, column, descending)
+        if not partial_results:
+            return version, np.empty(0, dtype=np.int64)
+        values = np.concatenate([x[0] for x in partial_results])
+        positions = np.concatenate([x[1] for x in partial_results])
+        # Each shard is already sorted. Stable sort merges the sorted runs keeping the order of
+        # the equal values
+        order = np.argsort(values, kind="stable")
+        return version, positions[order]
+
+    def close(self):
+        """ Shutdown the pool and remove the files """
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown()
+        self._pool = None
+        if self._owner_pid == os.getpid():
+            for directory in (self._directory, self._stale_directory):
+                if directory is not None:
+                    shutil.rmtree(directory, ignore_errors=True)
+        self._directory = None
+        self._stale_directory = None
+        self._version = None
+
+
+class DealColumns:
+    """
+    Columns of a snapshot as numpy arrays for in-process filtering. Filtering reads the array
+    buffers and touches only the matching row dicts. So after preload a worker doesn't update the
+    refcount of every row shared with the gunicorn master, which would copy their pages.
+    """
+
+    def __init__(self, potential_records):
+        self.arrays = ShardedDealStore.get_columns(potential_records)
+        self._no_of_rows = len(potential_records)
+
+    def __len__(self):
+        return self._no_of_rows
+
+    def filter(self, criteria):
+        """ Positions of the rows matching the filter criteria """
+        return np.flatnonzero(_get_shard_mask(self.arrays, 0, self._no_of_rows, criteria))
+
+    def count_years(self):
+        """ List of (year, no of vehicles) sorted by year DESC """
+        years = self.arrays["year"]
+        values, counts = np.unique(years[years > 0], return_counts=True)
+        return sorted(
+            ((str(year), count) for year, count in zip(values.tolist(), counts.tolist())),
+            reverse=True
+        )
@@ -0,0 +1,69 @@
+"""
+File:           singleflight.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:09 am
+"""
+import threading
+from collections import defaultdict
+
+
+class _Call:
+    """ In flight call shared by all the callers of the same key """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce identical concurrent calls. While a call for a key is in flight, other callers of the
+    same key wait for it and get the same result instead of running it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counters = defaultdict(lambda: {"calls": 0, "executions": 0, "coalesced": 0})
+
+    def do(self, key, func, *args, **kwargs):
+        """ Run func for the key unless it is already running. Key must be hashable """
+        name = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            counters = self._counters[name]
+            counters["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                counters["coalesced"] += 1
+                is_leader = False
+            else:
+                call = self._calls[key] = _Call()
+                counters["executions"] += 1
+                is_leader = True
+
+        if not is_leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except Exception as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """ Counters for each call name """
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._counters.items()}
+
+
+# Shared by the whole process
+singleflight = SingleFlight()
@@ -0,0 +1,93 @@
+"""
+File:           snapshot.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:08 am
+"""
+import hashlib
+import threading
+from collections import deque
+
+
+class DealChangeLog:
+    """
+    Track the version of the potential deal snapshot and the row ids changed between versions.
+    Version is a digest of the snapshot content, so every worker loading the same data from db
+    ends up with the same version.
+    """
+    # No of versions for which changes are kept. Older clients get a full reload.
+    MAX_ENTRIES = 50
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._row_digests = {}
+        # List of (previous version, version, changed ids, removed ids)
+        self._entries = deque(maxlen=DealChangeLog.MAX_ENTRIES)
+
+    @property
+    def version(self):
+        return self._version
+
+    @staticmethod
+    def get_row_digest(record):
+        """ Digest of a single row """
+        return hashlib.md5(repr(tuple(record.items())).encode()).hexdigest()
+
+    def prepare(self, records):
+        """
+        Compute the new version from the records and the changes since the current version. Every
+        row is hashed, so it is called without holding any lock. Return (previous version,
+        version, changed ids, removed ids, row digests), which is applied with commit.
+        """
+        row_digests = {}
+        snapshot_digest = hashlib.md5()
+        for record in records:
+            row_digest = DealChangeLog.get_row_digest(record)
+            row_digests[record["PotentialDealID"]] = row_digest
+            snapshot_digest.update(row_digest.encode())
+        version = snapshot_digest.hexdigest()[:16]
+        with self._lock:
+            previous_version = self._version
+            previous_row_digests = self._row_digests
+        if previous_version is None:
+            # First load, everything is new
+            changed_ids = frozenset(row_digests)
+            removed_ids = frozenset()
+        else:
+            changed_ids = frozenset(
+                potential_deal_id
+                for potential_deal_id, row_digest in row_digests.items()
+                if previous_row_digests.get(potential_deal_id) != row_digest
+            )
+            removed_ids = frozenset(previous_row_digests.keys() - row_digests.keys())
+        return previous_version, version, changed_ids, removed_ids, row_digests
+
+    def commit(self, update):
+        """ Make the update returned by prepare the current version. Only swaps references """
+        previous_version, version, changed_ids, removed_ids, row_digests = update
+        with self._lock:
+            if previous_version is not None and version != previous_version:
+                self._entries.append((previous_version, version, changed_ids, removed_ids))
+            self._version = version
+            self._row_digests = row_digests
+
+    def get_changes_since(self, version):
+        """
+        Return (changed ids, removed ids) from version to the current version. Return None if the
+        version is too old or unknown to this process.
+        """
+        with self._lock:
+            if version == self._version:
+                return frozenset(), frozenset()
+            entries = list(self._entries)
+        start = next(
+            (index for index, entry in enumerate(entries) if entry[0] == version), None
+        )
+        if start is None:
+            return None
+        changed_ids = set()
+        removed_ids = set()
+        for _, _, entry_changed_ids, entry_removed_ids in entries[start:]:
+            changed_ids = (changed_ids - entry_removed_ids) | entry_changed_ids
+            removed_ids = (removed_ids - entry_changed_ids) | entry_removed_ids
+        return frozenset(changed_ids), frozenset(removed_ids)
@@ -0,0 +1,172 @@
+"""
+File:           standin_db.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:06 am
+
+Stand-in for the MySQL database with synthetic data. Used by the load test and benchmarks so
+that they don't need access to the production database.
+"""
+import os
+import random
+import time
+
+from db import DBApi
+
+
+# Small vauto_make_model catalog for the synthetic deals
+STANDIN_MAKE_MODELS = {
+    "Toyota": ["Camry", "Corolla", "RAV4", "Highlander", "Tacoma", "Tundra", "Prius"],
+    "Honda": ["Civic", "Accord", "CR-V", "Pilot", "Odyssey", "Fit"],
+    "Ford": ["F-150", "Escape", "Explorer", "Focus", "Fusion", "Mustang"],
+    "Chevrolet": ["Silverado", "Malibu", "Equinox", "Tahoe", "Camaro"],
+    "Nissan": ["Altima", "Sentra", "Rogue", "Pathfinder", "Frontier"],
+    "BMW": ["3 Series", "5 Series", "X3", "X5"],
+    "Tesla": ["Model 3", "Model S", "Model X", "Model Y"],
+    "Subaru": ["Outback", "Forester", "Impreza", "Crosstrek"],
+}
+
+
+class StandInDBApi(DBApi):
+    """ DBApi returning synthetic data instead of querying the database """
+    # Configuration through environment variables so that gunicorn workers pick it up
+    NO_OF_DEALS = int(os.environ.get("AUTOCLOUD_STANDIN_DEALS", 20000))
+    # Simulated query latency in milliseconds
+    LATENCY_MS = float(os.environ.get("AUTOCLOUD_STANDIN_LATENCY_MS", 20))
+    SEED = int(os.environ.get("AUTOCLOUD_STANDIN_SEED", 7))
+    # No of deals changed and added every CHURN_INTERVAL seconds
+    CHURN = int(os.environ.get("AUTOCLOUD_STANDIN_CHURN", 10))
+    CHURN_INTERVAL = float(os.environ.get("AUTOCLOUD_STANDIN_CHURN_INTERVAL", 10))
+    # Start of the churn. The load test sets it, so all the workers see the same data like they
+    # would with a real database.
+    EPOCH = float(os.environ.get("AUTOCLOUD_STANDIN_EPOCH", time.time()))
+
+    def __init__(self, no_of_deals=None):
+        # No engine or connection for stand-in
+        self._engine = None
+        self._conn = None
+        self._init_cache()
+        self._no_of_deals = no_of_deals or StandInDBApi.NO_OF_DEALS
+        self._saved_filters = []
+
+    def __del__(self):
+        pass
+
+    @staticmethod
+    def _simulate_latency():
+        if StandInDBApi.LATENCY_MS:
+            time.sleep(StandInDBApi.LATENCY_MS / 1000)
+
+    @staticmethod
+    def generate_potential_records(no_of_deals, seed=None):
+        """ Generate synthetic vw_Deal rows ordered by PotentialDealID DESC """
+        rand = random.Random(StandInDBApi.SEED if seed is None else seed)
+        makes = sorted(STANDIN_MAKE_MODELS)
+        records = []
+        for potential_deal_id in range(no_of_deals, 0, -1):
+            make = rand.choice(makes)
+            model = rand.choice(STANDIN_MAKE_MODELS[make])
+            year = rand.randint(2005, 2021)
+            records.append({
+                "PotentialDealID": potential_deal_id,
+                "make_model_year": f"{year} {make} {model}",
+                "odometer": rand.randint(1000, 250000),
+                "price": rand.randint(2000, 90000),
+                "OfferPricePctMMR": rand.randint(60, 140),
+                "url": f"https://example.com/deal/{potential_deal_id}",
+                "Action": None,
+                "Comment": "",
+            })
+        return records
+
+    @staticmethod
+    def get_generation():
+        """ No of times the synthetic data has changed since the epoch """
+        if not StandInDBApi.CHURN or StandInDBApi.CHURN_INTERVAL <= 0:
+            return 0
+        return max(0, int((time.time() - StandInDBApi.EPOCH) // StandInDBApi.CHURN_INTERVAL))
+
+    def _query_potential_records(self):
+        """ Synthetic rows of vw_Deal. Some deals are changed and added every CHURN_INTERVAL """
+        self._simulate_latency()
+        generation = self.get_generation()
+        records = self.generate_potential_records(self._no_of_deals)
+        for generation_no in range(1, generation + 1):
+            new_records = self.generate_potential_records(StandInDBApi.CHURN, seed=generation_no)
+            for index, record in enumerate(new_records):
+                record["PotentialDealID"] = \
+                    self._no_of_deals + StandInDBApi.CHURN * generation_no - index
+            records = new_records + records
+        if generation:
+            rand = random.Random(generation)
+            for record in rand.sample(records, min(StandInDBApi.CHURN, len(records))):
+                record["price"] = rand.randint(2000, 90000)
+        return records
+
+    def _query_potential_records_checksum(self):
+        """ Synthetic data only changes with the generation, so it is the checksum """
+        return (self.get_generation(),)
+
+    def get_potential_deal_columns(self):
+        """ Get potential deal column name """
+        return [
+            "PotentialDealID", "make_model_year", "odometer", "price", "OfferPricePctMMR", "url",
+            "Action", "Comment"
+        ]
+
+    def get_all_make_models(self):
+        """ Get all the rows for make_model columns """
+        self._simulate_latency()
+        return {make: list(models) for make, models in STANDIN_MAKE_MODELS.items()}
+
+    def save_actions_comments(self, records):
+        """ Save action and comments to db """
+        self._simulate_latency()
+
+    def bulk_update_actions_comments(self, potential_deal_ids, action=None, comment=None):
+        """ Set action and/or comment for all the potential deal ids """
+        self._simulate_latency()
+        columns = {}
+        if action is not None:
+            columns["Action"] = action
+        if comment is not None:
+            columns["Comment"] = comment
+        updated_ids = set(potential_deal_ids)
+        if columns:
+            for potential_deal_id in updated_ids:
+                record = self._potential_records_by_id.get(potential_deal_id)
+                if record is not None:
+                    record.update(columns)
+        return len(updated_ids) if columns else 0
+
+    def save_filter(self, name, year, make, model, min_odometer, max_odometer, min_price, max_price,
+                    min_offer_price, max_offer_price):
+        """ Save the filter for future use """
+        self._simulate_latency()
+        self._saved_filters.append({
+            "name": name, "year": year, "make": make, "model": model,
+            "min_odometer": min_odometer, "max_odometer": max_odometer, "min_price": min_price,
+            "max_price": max_price, "min_offer_price": min_offer_price,
+            "max_offer_price": max_offer_price,
+        })
+
+    def get_all_filters(self):
+        """ Get all the rows for filters """
+        self._simulate_latency()
+        default_filters = [
+            {"name": "Cheap Toyota", "year": "", "make": "toyota", "model": "",
+             "min_odometer": "", "max_odometer": "", "min_price": "", "max_price": "15000",
+             "min_offer_price": "", "max_offer_price": ""},
+            {"name": "Recent low miles", "year": "2019,2020,2021", "make": "", "model": "",
+             "min_odometer": "", "max_odometer": "30000", "min_price": "", "max_price": "",
+             "min_offer_price": "", "max_offer_price": ""},
+        ]
+        self._filters = default_filters + self._saved_filters
+        return self._filters
+
+
+def create_standin_app():
+    """ Create the app with the stand-in database. Entry point for gunicorn """
+    DBApi.set_instance(StandInDBApi())
+    # Import after setting the instance so that the app never creates a real db connection
+    from wsgi import create_app
+    return create_app()
@@ -0,0 +1,95 @@
+"""
+File:           test_sharded_store.py
+Author:         Dibyaranjan Sathua
+Created on:     19/10/26, 6:28 am
+
+Sharded filter must return the same rows as the in-process filter.
+"""
+import os
+import random
+
+import pytest
+
+from filters import filter_potential_records, get_filter_criteria
+from sharded_store import ShardedDealStore, DealColumns
+
+
+MAKE_MODELS = [
+    ("Toyota", "Camry"), ("Honda", "CR-V"), ("Land Rover", "Range Rover"), ("BMW", "3 Series"),
+    ("Ford", "F-150"),
+]
+
+CRITERIA = [
+    get_filter_criteria([], [], [], "", "", "", "", "", ""),
+    get_filter_criteria(["2019", "2020"], [], [], "", "", "", "", "", ""),
+    get_filter_criteria([], ["toyota", "land rover"], [], "", "", "", "", "", ""),
+    # Saved filters have the labels and empty values from splitting an empty string
+    get_filter_criteria([""], ["Toyota", ""], [""], "", "", "", "", "", ""),
+    get_filter_criteria([], [None, "honda"], ["CR-V"], "", "", "", "", "", ""),
+    get_filter_criteria([], [], ["range rover"], 10000, 90000, "", "", "", ""),
+    get_filter_criteria([], [], [], "", "", 5000, 40000, 80, 120),
+    get_filter_criteria(["2015"], ["bmw"], [], "", 150000, "", 60000, "", 110),
+]
+
+
+def get_potential_records(no_of_deals, seed=3):
+    """ Potential deal rows with missing values, ordered by PotentialDealID DESC """
+    rand = random.Random(seed)
+    records = []
+    for potential_deal_id in range(no_of_deals, 0, -1):
+        make, model = rand.choice(MAKE_MODELS)
+        make_model_year = f"{rand.randint(2010, 2021)} {make} {model}"
+        records.append({
+            "PotentialDealID": potential_deal_id,
+            "make_model_year": None if rand.random() < 0.02 else make_model_year,
+            "odometer": None if rand.random() < 0.05 else rand.randint(1000, 200000),
+            "price": None if rand.random() < 0.05 else rand.randint(2000, 90000),
+            "OfferPricePctMMR": rand.randint(60, 140),
+        })
+    return records
+
+
+@pytest.fixture(scope="module")
+def potential_records():
+    return get_potential_records(2000)
+
+
+@pytest.fixture(scope="module")
+def sharded_store(potential_records):
+    store = ShardedDealStore(no_of_shards=3)
+    store.load(potential_records, version="test")
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("criteria", CRITERIA)
+def test_sharded_filter_matches_in_process_filter(potential_records, sharded_store, criteria):
+    version, positions = sharded_store.filter(criteria)
+    sharded_ids = [potential_records[x]["PotentialDealID"] for x in positions.tolist()]
+    expected_ids = [
+        data["PotentialDealID"] for data in filter_potential_records(potential_records, criteria)
+    ]
+    assert version == "test"
+    assert sharded_ids == expected_ids
+
+
+@pytest.mark.parametrize("criteria", CRITERIA)
+def test_columns_filter_matches_in_process_filter(potential_records, criteria):
+    positions = DealColumns(potential_records).filter(criteria)
+    columns_ids = [potential_records[x]["PotentialDealID"] for x in positions.tolist()]
+    expected_ids = [
+        data["PotentialDealID"] for data in filter_potential_records(potential_records, criteria)
+    ]
+    assert columns_ids == expected_ids
+
+
+def test_close_removes_the_column_files(potential_records):
+    store = ShardedDealStore(no_of_shards=1)
+    store.load(potential_records, version="v1")
+    store.load(potential_records, version="v2")
+    directories = [store.directory]
+    store.load(potential_records, version="v3")
+    directories.append(store.directory)
+    store.close()
+    for directory in directories:
+        assert not os.path.exists(directory)